@@ -0,0 +1,45 @@
+''' 
+    Measures the per-call overhead of the contracts checks, 
+    comparing the default mode with set_fast_mode(). 
+    
+        python benchmarks/bench_fast_mode.py
+'''
+from astatsa import set_fast_mode
+from astatsa.expectation import ExpectationFast
+from astatsa.expectation_weighted import ExpectationWeighted
+from astatsa.mean_variance import MeanVariance
+from astatsa.prediction import PredictionStats
+import numpy as np
+import timeit
+
+
+def bench_updates(number=2000, n=10):
+    x = np.random.rand(n)
+    w = np.ones(n)
+    cases = [
+        ('ExpectationFast.update', ExpectationFast(), lambda a: a.update(x)),
+        ('MeanVariance.update', MeanVariance(), lambda a: a.update(x)),
+        ('ExpectationWeighted.update', ExpectationWeighted(),
+         lambda a: a.update(x, w)),
+        ('PredictionStats.update', PredictionStats(),
+         lambda a: a.update(x, x)),
+    ]
+    results = {}
+    for name, acc, f in cases:
+        t = timeit.timeit(lambda: f(acc), number=number)
+        results[name] = 1e6 * t / number
+    return results
+
+
+def main():
+    set_fast_mode(False)
+    checked = bench_updates()
+    set_fast_mode(True)
+    fast = bench_updates()
+    print('%-30s %12s %12s' % ('', 'checked [us]', 'fast [us]'))
+    for name in sorted(checked):
+        print('%-30s %12.2f %12.2f' % (name, checked[name], fast[name]))
+
+
+if __name__ == '__main__':
+    main()
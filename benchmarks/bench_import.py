@@ -0,0 +1,36 @@
+''' 
+    Measures the time to import astatsa in a fresh interpreter,
+    and to import it and access one accumulator. 
+    
+        python benchmarks/bench_import.py
+'''
+import subprocess
+import sys
+import time
+
+STATEMENTS = [
+    ('pass', 'import sys'),
+    ('import astatsa', 'import astatsa'),
+    ('astatsa.MeanVariance', 'import astatsa; astatsa.MeanVariance'),
+    ('astatsa.MeanCovariance', 'import astatsa; astatsa.MeanCovariance'),
+]
+
+
+def time_statement(statement, repeat=5):
+    ''' Returns the best wall time over repeat fresh interpreters. '''
+    best = None
+    for _ in range(repeat):
+        t0 = time.time()
+        subprocess.check_call([sys.executable, '-c', statement])
+        t = time.time() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    for name, statement in STATEMENTS:
+        print('%-25s %8.1f ms' % (name, 1000 * time_statement(statement)))
+
+
+if __name__ == '__main__':
+    main()
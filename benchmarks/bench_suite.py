@@ -0,0 +1,235 @@
+'''
+    Benchmarks of all the accumulators over grids of dimensions and
+    sample counts: update and getter throughput, peak memory (from
+    tracemalloc) and import time.
+
+        python benchmarks/bench_suite.py [--quick] [--checks] [--filter name]
+
+    Each run is appended to benchmarks/history.jsonl (one JSON object
+    per line, with the git commit and the versions) and compared with
+    the previous run on the same machine with the same settings (grid 
+    and fast mode).
+'''
+from astatsa import (set_fast_mode, ExpectationSlow, ExpectationFast,
+    ExpectationFaster, ExpectationWeighted, MeanVariance, MeanCovariance,
+    PredictionStats, cov2corr)
+from bench_import import time_statement
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+import numpy as np
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'history.jsonl')
+
+# (dimension n, number of samples N)
+GRID = [(10, 1000), (100, 1000), (1000, 100)]
+GRID_QUICK = [(10, 200), (100, 100)]
+
+COV2CORR_SIZES = [100, 1000, 3000]
+COV2CORR_SIZES_QUICK = [100, 500]
+
+
+def accumulator_cases(n):
+    '''
+        Returns a list of (name, factory, update, getter), where
+        update(acc, x) gives the sample x to the accumulator.
+    '''
+    w = np.random.rand(n)
+    plain = lambda a, x: a.update(x)
+    return [
+        ('ExpectationSlow', ExpectationSlow, plain, lambda a: a.get_value()),
+        ('ExpectationFast', ExpectationFast, plain, lambda a: a.get_value()),
+        ('ExpectationFaster', ExpectationFaster, plain,
+         lambda a: a.get_value()),
+        ('ExpectationWeighted', ExpectationWeighted,
+         lambda a, x: a.update(x, w), lambda a: a.get_value()),
+        ('MeanVariance', MeanVariance, plain, lambda a: a.get_std_dev()),
+        ('MeanCovariance', MeanCovariance, plain,
+         lambda a: a.get_correlation()),
+        # None: a single update_batch()
+        ('MeanCovariance.update_batch', MeanCovariance, None,
+         lambda a: a.get_correlation()),
+        ('PredictionStats', PredictionStats,
+         lambda a, x: a.update(x, x[::-1].copy()),
+         lambda a: a.get_correlation()),
+    ]
+
+
+def bench_accumulator(factory, update, getter, X):
+    '''
+        Returns a dict with the update time per sample, the getter time
+        and the peak memory of the updates, in bytes.
+    '''
+    N = X.shape[0]
+    acc = factory()
+    t0 = time.perf_counter()
+    if update is None:
+        acc.update_batch(X)
+    else:
+        for i in range(N):
+            update(acc, X[i])
+    t_update = (time.perf_counter() - t0) / N
+
+    # the getters are cached until the next update, so we time the first 
+    # call after one
+    if update is None:
+        acc.update_batch(X[:1])
+    else:
+        update(acc, X[0])
+    t0 = time.perf_counter()
+    getter(acc)
+    t_getter = time.perf_counter() - t0
+
+    tracemalloc.start()
+    acc = factory()
+    if update is None:
+        acc.update_batch(X)
+    else:
+        for i in range(min(N, 50)):
+            update(acc, X[i])
+    getter(acc)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'update_us': 1e6 * t_update, 'getter_us': 1e6 * t_getter,
+            'peak_bytes': peak}
+
+
+def bench_cov2corr(n, number=3):
+    A = np.random.randn(n, n)
+    C = np.dot(A, A.T)
+    out = np.empty_like(C)
+    t = timeit.timeit(lambda: cov2corr(C), number=number) / number
+    t_out = timeit.timeit(lambda: cov2corr(C, out=out),
+                          number=number) / number
+    tracemalloc.start()
+    cov2corr(C, out=out, block_rows=max(1, n // 16))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time_us': 1e6 * t, 'time_out_us': 1e6 * t_out,
+            'peak_bytes_out': peak}
+
+
+def run(quick=False, name_filter=None):
+    results = {}
+    for n, N in grid(quick):
+        X = np.random.randn(N, n)
+        for name, factory, update, getter in accumulator_cases(n):
+            key = '%s n=%d N=%d' % (name, n, N)
+            if name_filter and not name_filter in key:
+                continue
+            results[key] = bench_accumulator(factory, update, getter, X)
+            print_result(key, results[key])
+
+    for n in cov2corr_sizes(quick):
+        key = 'cov2corr n=%d' % n
+        if not name_filter or name_filter in key:
+            results[key] = bench_cov2corr(n)
+            print_result(key, results[key])
+
+    for statement in ['import astatsa',
+                      'import astatsa; astatsa.MeanCovariance']:
+        key = 'import: %s' % statement
+        if not name_filter or name_filter in key:
+            ms = 1000 * time_statement(statement, repeat=3 if quick else 5)
+            results[key] = {'time_ms': ms}
+            print_result(key, results[key])
+    return results
+
+
+def grid(quick):
+    return GRID_QUICK if quick else GRID
+
+
+def cov2corr_sizes(quick):
+    return COV2CORR_SIZES_QUICK if quick else COV2CORR_SIZES
+
+
+def settings(quick, fast_mode):
+    ''' The settings of a run; only runs with the same are compared. '''
+    return {'quick': quick, 'fast_mode': fast_mode,
+            'grid': [list(x) for x in grid(quick)],
+            'cov2corr_sizes': cov2corr_sizes(quick)}
+
+
+def print_result(key, result):
+    values = ', '.join('%s=%s' % (k, format_value(result[k]))
+                       for k in sorted(result))
+    print('%-45s %s' % (key, values))
+
+
+def format_value(x):
+    return '%d' % x if isinstance(x, int) else '%.2f' % x
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      stderr=subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(previous, results):
+    ''' Prints the ratios of the times with respect to a previous run. '''
+    print('\nCompared with %s (%s):' % (previous['commit'], previous['date']))
+    for key in sorted(results):
+        if not key in previous['results']:
+            continue
+        for k, v in sorted(results[key].items()):
+            v0 = previous['results'][key].get(k)
+            if v0:
+                ratio = v / v0
+                flag = '  <--' if ratio > 1.2 else ''
+                print('%-45s %-15s %6.2fx%s' % (key, k, ratio, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of astatsa.')
+    parser.add_argument('--quick', action='store_true',
+                        help='Use a smaller grid.')
+    parser.add_argument('--checks', action='store_true',
+                        help='Keep the contracts checks (no fast mode).')
+    parser.add_argument('--filter', default=None,
+                        help='Only run the cases containing this string.')
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--no-save', action='store_true',
+                        help='Do not append the results to the history.')
+    args = parser.parse_args()
+
+    # by default, we measure the computation, not the checks
+    fast_mode = not args.checks
+    set_fast_mode(fast_mode)
+    results = run(quick=args.quick, name_filter=args.filter)
+
+    entry = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+             'commit': git_commit(), 'machine': platform.node(),
+             'python': platform.python_version(), 'numpy': np.__version__,
+             'settings': settings(args.quick, fast_mode), 'results': results}
+    # (the records written before the settings were recorded are skipped)
+    history = [h for h in load_history(args.history)
+               if h['machine'] == entry['machine'] and 
+               h.get('settings') == entry['settings']]
+    if history:
+        compare(history[-1], results)
+    if not args.no_save:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,54 @@
 __version__ = '1.0'
 
+import importlib
 import logging
-logging.basicConfig()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
-from .expectation import *
-from .expectation_weighted import *
-from .mean_variance import *
-from .prediction import *
+# The subpackages are imported on first access, so that "import astatsa"
+# does not pay for numpy, PyContracts and whatever we do not use.
+_lazy_names = {
+    'Expectation': 'expectation',
+    'ExpectationSlow': 'expectation',
+    'ExpectationFast': 'expectation',
+    'ExpectationFaster': 'expectation',
+    'ExpectationWindowed': 'expectation',
+    'ExpectationTiled': 'expectation',
+    'ExpectationWeighted': 'expectation_weighted',
+    'ExpectationWeightedInterface': 'expectation_weighted',
+    'MeanVariance': 'mean_variance',
+    'MeanCovariance': 'mean_covariance',
+    'MeanCovarianceSketch': 'mean_covariance',
+    'cov2corr': 'mean_covariance',
+    'PredictionStats': 'prediction',
+    'AsyncAccumulator': 'aio',
+    'Sharded': 'sharded',
+    'set_fast_mode': 'utils',
+    'in_fast_mode': 'utils',
+    'set_instrumentation': 'utils',
+    'get_instrumentation': 'utils',
+    'reset_instrumentation': 'utils',
+    'save_state': 'utils',
+    'load_state': 'utils',
+    'restore': 'utils',
+}
+
+_lazy_submodules = ['aio', 'expectation', 'expectation_weighted',
+                    'mean_covariance', 'mean_variance', 'parallel',
+                    'prediction', 'sharded', 'stream', 'utils']
+
+__all__ = sorted(_lazy_names)
+
+
+def __getattr__(name):
+    if name in _lazy_names:
+        module = importlib.import_module('.' + _lazy_names[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _lazy_submodules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names) | set(_lazy_submodules))
@@ -0,0 +1,167 @@
+'''
+    An asyncio front-end for the accumulators.
+
+    AsyncAccumulator queues the samples given to put() and applies them
+    in micro-batches in an executor, so that large updates (for example,
+    of a MeanCovariance) do not block the event loop.
+'''
+import asyncio
+import copy
+import numpy as np
+
+from .parallel import feed_chunk
+
+__all__ = ['AsyncAccumulator']
+
+
+class AsyncAccumulator(object):
+    '''
+        Wraps an accumulator for use from coroutines::
+
+            acc = AsyncAccumulator(MeanCovariance())
+            await acc.put(value, dt)
+            ...
+            mc = await acc.snapshot()
+
+        The queue is bounded, so put() waits when the executor cannot
+        keep up (backpressure). The queued samples are stacked and given
+        to the accumulator's update_batch(), if it has one (see
+        parallel.feed_chunk()). The accumulator must not be used directly
+        while it is wrapped.
+
+        If the update of a batch fails (for example, because a sample
+        is not finite), its samples are applied one by one, so that only
+        the invalid ones are rejected. This requires an update_batch()
+        that applies all the samples or none (the accumulator's
+        atomic_update_batch attribute); otherwise, the samples are
+        always applied one by one. The next put() or join() raises
+        the error of the rejected sample or, if there were several, a
+        ValueError whose attribute errors lists all of them;
+        num_rejected counts the samples rejected so far.
+    '''
+
+    def __init__(self, accumulator, max_queue=1024, max_batch=256,
+                 executor=None):
+        '''
+            :param accumulator: The accumulator to update.
+            :param max_queue: Maximum number of samples waiting.
+            :param max_batch: Maximum number of samples per batch.
+            :param executor: A concurrent.futures executor; by default,
+                the default executor of the event loop.
+        '''
+        if max_queue < 1 or max_batch < 1:
+            raise ValueError('Invalid max_queue %r or max_batch %r.' %
+                             (max_queue, max_batch))
+        self.accumulator = accumulator
+        self.max_batch = max_batch
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # held while the accumulator is being updated or read
+        self.lock = asyncio.Lock()
+        self.task = None
+        # the errors not reported yet
+        self.errors = []
+        self.num_rejected = 0
+
+    async def put(self, value, dt=1.0):
+        '''
+            Queues a sample, waiting if the queue is full. The second
+            argument is passed to the update as is (dt, or the weight for
+            ExpectationWeighted).
+        '''
+        self._check_error()
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        await self.queue.put((value, dt))
+
+    async def join(self):
+        ''' Waits until all the queued samples have been applied. '''
+        await self.queue.join()
+        self._check_error()
+
+    async def snapshot(self, function=None):
+        '''
+            Waits for the queued samples to be applied, then returns
+            function(accumulator) or, by default, a copy of the
+            accumulator. The function runs in the executor, while no
+            update is in progress.
+        '''
+        await self.join()
+        if function is None:
+            function = copy.deepcopy
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function,
+                                              self.accumulator)
+
+    async def close(self):
+        ''' Applies the queued samples and stops the background task. '''
+        await self.join()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def _check_error(self):
+        if not self.errors:
+            return
+        errors, self.errors = self.errors, []
+        if len(errors) == 1:
+            raise errors[0]
+        msg = ('%d samples were rejected; the first error: %s' %
+               (len(errors), errors[0]))
+        error = ValueError(msg)
+        error.errors = errors
+        raise error
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            errors = []
+            try:
+                async with self.lock:
+                    errors = await loop.run_in_executor(self.executor,
+                                                        self._apply, batch)
+            except Exception as e:
+                errors = [e]
+            finally:
+                # reported by the next put() or join()
+                self.errors.extend(errors)
+                self.num_rejected += len(errors)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _apply(self, batch):
+        ''' Applies the batch; returns the errors of the rejected samples. '''
+        if not getattr(self.accumulator, 'atomic_update_batch', False):
+            # a failed batch could have been applied in part
+            return self._apply_each(batch)
+        try:
+            self._feed(batch)
+            return []
+        except Exception as e:
+            if len(batch) == 1:
+                return [e]
+        # one invalid sample should not drop the others
+        return self._apply_each(batch)
+
+    def _apply_each(self, batch):
+        ''' Applies the samples one by one; returns the errors. '''
+        errors = []
+        for sample in batch:
+            try:
+                self._feed([sample])
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def _feed(self, batch):
+        values = np.array([value for value, _ in batch])
+        dts = np.array([dt for _, dt in batch], dtype='float64')
+        feed_chunk(self.accumulator, (values, dts))
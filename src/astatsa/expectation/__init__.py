@@ -1,5 +1,6 @@
 
-__all__ = ['Expectation', 'ExpectationSlow', 'ExpectationFast']
+__all__ = ['Expectation', 'ExpectationSlow', 'ExpectationFast',
+           'ExpectationWindowed', 'ExpectationTiled']
 
 from contracts import contract
 import numpy as np
@@ -7,5 +8,7 @@ import numpy as np
 from .interface import ExpectationInterface
 from .expectation_fast import ExpectationFast, ExpectationFaster
 from .expectation_slow import ExpectationSlow 
+from .expectation_windowed import ExpectationWindowed
+from .expectation_tiled import ExpectationTiled
 
 Expectation = ExpectationFast
@@ -1,68 +1,283 @@
 from . import ExpectationInterface, contract, np
-from astatsa.utils import check_all_finite
-import warnings
+from astatsa.utils import (contracts_bypassable, compensated_add, 
+    compensation_scratch, Validation)
+from astatsa.utils.state import new_state, check_state, dtype_name
+from astatsa.utils.instrumentation import Instrumentation, record_event
 
 __all__ = ['ExpectationFast', 'ExpectationFaster']
 
 
+@contracts_bypassable
 class ExpectationFast(ExpectationInterface):
-    ''' A more efficient implementation. '''
+    ''' 
+        A more efficient implementation. 
+        
+        The accumulator holds the sum of value * dt, multiplied by a 
+        power of two (scale). Once every renormalize_interval updates,
+        if the largest element of the sum is within HEADROOM_BITS 
+        binary orders of magnitude of overflow (or of underflow), the 
+        sum is rescaled by a power of two, which is exact. The mean and 
+        the weights of the samples are not affected, and the cost of 
+        the check is amortized over the interval.
+    '''
 
-    MAX_MASS = 100  # TODO: watch np.max(self.accum) instead
+    RENORMALIZE_INTERVAL = 1024
+    HEADROOM_BITS = 64
+    # Deprecated and not used: the sum was normalized when the mass 
+    # exceeded this; it is now rescaled as described above.
+    MAX_MASS = 100
+    # update_batch() checks the batch before changing anything, so a 
+    # batch that fails is not applied at all (see AsyncAccumulator)
+    atomic_update_batch = True
 
-    def __init__(self, max_window=None, extremely_fast=False):
+    def __init__(self, max_window=None, extremely_fast=False,
+                 accum_dtype=None, compensated=False, validation='always',
+                 renormalize_interval=RENORMALIZE_INTERVAL):
         '''  
-            extremely_fast: saves memory; might crash on some python 
-            interpreters
-            TODO: put automatic tests to detect this
+            extremely_fast: update() and get_value() work in preallocated
+            buffers, so that they do not allocate memory after the first 
+            update. The array returned by get_value() is then overwritten
+            by the following updates. (ExpectationFaster sets this.)
+            
+            accum_dtype: dtype of the accumulator; by default, the one
+            of value * dt. Use 'float64' to accumulate float32 inputs 
+            without loss of precision.
+            
+            compensated: use Neumaier (Kahan) summation, so that even 
+            a float32 accumulator stays accurate over many samples.
+            
+            validation: when to check that the values are finite 
+            (see Validation).
+            
+            renormalize_interval: number of updates between the checks 
+            of the magnitude of the sum; None to never rescale it.
         '''
+        if renormalize_interval is not None and renormalize_interval < 1:
+            raise ValueError('Invalid renormalize_interval %r.' % 
+                             renormalize_interval)
         self.max_window = max_window
         self.accum_mass = 0.0
         self.accum = None
+        self.compensation = None
         self.needs_normalization = True
         self.extremely_fast = extremely_fast
+        self.accum_dtype = accum_dtype
+        self.compensated = compensated
+        self.validation = Validation.from_policy(validation)
+        self.renormalize_interval = renormalize_interval
+        self.updates_since_check = 0
+        self.scale = 1.0
         
     def merge(self, other):
-        warnings.warn('to test')
+        ''' Merges the samples seen by another ExpectationFast. '''
         assert isinstance(other, ExpectationFast)
-        self.update(other.get_value(), other.accum_mass)
+        if other.accum is None:
+            return
+        self.update(other.get_value(), float(other.accum_mass))
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, max_window=self.max_window,
+                          extremely_fast=self.extremely_fast,
+                          accum_dtype=dtype_name(self.accum_dtype),
+                          compensated=self.compensated,
+                          validation=self.validation.policy,
+                          validation_interval=self.validation.interval,
+                          renormalize_interval=self.renormalize_interval,
+                          accum_mass=self.accum_mass, scale=self.scale)
+        if self.accum is not None:
+            state['accum'] = self.accum
+            if self.compensated:
+                state['compensation'] = self.compensation
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        validation = Validation(state.get('validation', 'always'),
+                                state.get('validation_interval', 16))
+        params = dict(max_window=state['max_window'],
+                      accum_dtype=state['accum_dtype'],
+                      compensated=state['compensated'],
+                      validation=validation,
+                      renormalize_interval=state.get('renormalize_interval',
+                                                     cls.RENORMALIZE_INTERVAL))
+        if cls is ExpectationFast:
+            params['extremely_fast'] = state['extremely_fast']
+        e = cls(**params)
+        if 'accum' in state:
+            e.accum = state['accum']
+            e.accum_mass = state['accum_mass']
+            e.scale = state.get('scale', 1.0)
+            e._allocate_buffers(e.accum)
+            if e.compensated:
+                e.compensation = state['compensation']
+        return e
 
     @contract(cur_mass='float,>=0')
     def reset(self, cur_mass=1.0):
-        self.accum = self.get_value()
+        self.accum = self.get_value().copy()
         self.accum_mass = cur_mass
+        self.scale = 1.0
+        if self.compensated:
+            self.compensation.fill(0)
 
     @contract(value='array', dt='float,>=0')
     def update(self, value, dt=1.0):
-        check_all_finite(value)
+        self.validation.check_update(value)
 
         if self.accum is None:
-            self.accum = value * dt
+            self.accum = np.multiply(value, dt, dtype=self.accum_dtype)
             self.accum_mass = dt
+            self.scale = 1.0
             self.needs_normalization = True
-            self.buf = np.empty_like(value)
-            self.buf.fill(np.NaN)
-            self.result = np.empty_like(value)
-            self.result.fill(np.NaN)
+            self._allocate_buffers(self.accum)
         else:
-            if self.extremely_fast:
-                np.multiply(value, dt, self.buf)  # buf = value * dt
+            scaled_dt = dt * self.scale
+            if self.compensated:
+                np.multiply(value, scaled_dt, self.buf)
+                compensated_add(self.accum, self.compensation, self.buf,
+                                self.scratch)
+            elif self.extremely_fast:
+                np.multiply(value, scaled_dt, self.buf)  # buf = value * dt
                 np.add(self.buf, self.accum, self.accum)  # accum += buf
             else:
-                self.buf = value * dt
+                self.buf = np.multiply(value, scaled_dt, 
+                                       dtype=self.accum_dtype)
                 self.accum += self.buf
 
             self.needs_normalization = True
             self.accum_mass += dt
 
         if self.max_window and self.accum_mass > self.max_window:
-            self.accum = self.max_window * self.get_value()
-            self.accum_mass = self.max_window
+            self._clamp()
 
-        
-        # Do not let pass too much before normalization
-        if self.accum_mass > ExpectationFast.MAX_MASS:
-            self.get_value()
+        self._count_update()
+
+    @contract(values='array[Nx...]', dts='None|array[N](>=0)')
+    def update_batch(self, values, dts=None):
+        ''' 
+            Vectorized equivalent of calling update(values[i], dts[i]) 
+            for each i, including the max_window clamping.
+            
+            The samples before the mass reaches max_window are summed
+            in one reduction; after that, each update multiplies the mean
+            by max_window / (max_window + dt), so the rest of the batch
+            is folded with the suffix products of these factors.
+        '''
+        N = values.shape[0]
+        if N == 0:
+            return
+        self.validation.check_update(values)
+        if dts is None:
+            dts = np.ones(N)
+        else:
+            dts = np.asarray(dts, dtype='float64')
+
+        if self.accum is None:
+            dtype = self.accum_dtype or np.result_type(values, 1.0)
+            self.accum = np.zeros(values.shape[1:], dtype=dtype)
+            self.accum_mass = 0.0
+            self._allocate_buffers(self.accum)
+
+        mass = self.accum_mass + np.cumsum(dts)
+        W = self.max_window
+        if W and mass[-1] > W:
+            # first sample after which the mass is clamped
+            k = int(np.argmax(mass > W))
+        else:
+            k = N - 1
+
+        partial = np.tensordot(dts[:k + 1], values[:k + 1], axes=1)
+        if self.scale != 1.0:
+            partial *= self.scale
+        if self.compensated:
+            compensated_add(self.accum, self.compensation, partial)
+        else:
+            self.accum += partial
+        self.accum_mass = float(mass[k])
+        self.needs_normalization = True
+
+        if W and self.accum_mass > W:
+            mean = self._total() / self.accum_mass / self.scale
+            tail_dts = dts[k + 1:]
+            if tail_dts.size > 0:
+                factors = W / (W + tail_dts)
+                # suffix[i] = product of factors[i:]
+                suffix = np.cumprod(factors[::-1])[::-1]
+                after = np.append(suffix[1:], 1.0)
+                weights = (tail_dts / (W + tail_dts)) * after
+                mean = suffix[0] * mean + np.tensordot(weights,
+                                                       values[k + 1:], axes=1)
+            self.accum[...] = (W * self.scale) * mean
+            self.accum_mass = W
+            if self.compensated:
+                self.compensation.fill(0)
+
+        self._count_update()
+
+    def _count_update(self):
+        if self.renormalize_interval is None:
+            return
+        self.updates_since_check += 1
+        if self.updates_since_check >= self.renormalize_interval:
+            self.updates_since_check = 0
+            self._renormalize()
+
+    def _renormalize(self):
+        ''' 
+            Rescales the sum by a power of two if it is close to 
+            overflow or underflow; returns True if it did.
+        '''
+        # one pass, in the scratch buffer (if it has the same dtype)
+        buf = self.buf if self.buf.dtype == self.accum.dtype else None
+        largest = np.max(np.abs(self.accum, out=buf))
+        if not np.isfinite(largest) or largest == 0:
+            return False
+        info = np.finfo(self.accum.dtype)
+        # exponent of the largest element
+        _, e = np.frexp(largest)
+        if info.maxexp - e > ExpectationFast.HEADROOM_BITS and \
+           e - info.minexp > ExpectationFast.HEADROOM_BITS:
+            return False
+        # (a factor that can be represented)
+        factor = np.ldexp(1.0, int(np.clip(-e, -1000, 1000)))
+        self.accum *= factor
+        if self.compensated:
+            self.compensation *= factor
+        self.scale *= factor
+        if Instrumentation.enabled:
+            record_event(self, 'renormalizations')
+        return True
+
+    def _allocate_buffers(self, template):
+        self.buf = np.empty_like(template)
+        self.buf.fill(np.NaN)
+        self.result = np.empty_like(template)
+        self.result.fill(np.NaN)
+        self.scratch = None
+        if self.compensated:
+            self.compensation = np.zeros_like(template)
+            if self.extremely_fast:
+                self.scratch = compensation_scratch(template)
+
+    def _clamp(self):
+        if self.extremely_fast:
+            np.multiply(self.get_value(), self.max_window * self.scale,
+                        self.accum)
+        else:
+            self.accum = (self.max_window * self.scale) * self.get_value()
+        self.accum_mass = self.max_window
+        if self.compensated:
+            self.compensation.fill(0)
+
+    def _total(self):
+        ''' Returns the (scaled) sum, including the compensation. '''
+        if self.compensated:
+            return self.accum + self.compensation
+        else:
+            return self.accum
 
     def get_value(self):
         if self.accum is None:
@@ -70,13 +285,18 @@ class ExpectationFast(ExpectationInterface):
         if self.needs_normalization:
             # In the case dt=0 for the first sample
             if self.accum_mass > 0:
-                ratio = 1.0 / self.accum_mass
+                ratio = 1.0 / self.accum_mass / self.scale
             else:
-                ratio = 1.0
+                ratio = 1.0 / self.scale
             if self.extremely_fast:
-                np.multiply(ratio, self.accum, self.result)
+                if self.compensated:
+                    np.add(self.accum, self.compensation, self.result)
+                    self.result *= ratio
+                else:
+                    np.multiply(ratio, self.accum, self.result)
             else:
-                self.result = ratio * self.accum
+                self.result = ratio * self._total()
+            self.validation.check_read(self.result)
             self.needs_normalization = False
         return self.result
 
@@ -88,8 +308,14 @@ class ExpectationFast(ExpectationInterface):
 
 
 class ExpectationFaster(ExpectationFast):
-    def __init__(self):
-        ExpectationFast.__init__(self, extremely_fast=True)
+    def __init__(self, max_window=None, accum_dtype=None, compensated=False,
+                 validation='always',
+                 renormalize_interval=ExpectationFast.RENORMALIZE_INTERVAL):
+        ExpectationFast.__init__(self, max_window=max_window,
+                                 extremely_fast=True, accum_dtype=accum_dtype,
+                                 compensated=compensated,
+                                 validation=validation,
+                                 renormalize_interval=renormalize_interval)
         
         
         
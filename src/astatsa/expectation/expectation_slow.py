@@ -1,31 +1,74 @@
-from . import ExpectationInterface, contract
+from . import ExpectationInterface, contract, np
+from astatsa.utils import contracts_bypassable
+from astatsa.utils.state import new_state, check_state, dtype_name
 
 __all__ = ['ExpectationSlow']
 
 
+@contracts_bypassable
 class ExpectationSlow(ExpectationInterface):
     
     ''' A class to compute the mean of a quantity over time '''
-    def __init__(self, max_window=None):
+    def __init__(self, max_window=None, accum_dtype=None):
         ''' 
             If max_window is given, the covariance is computed
             over a certain interval. 
+            
+            If accum_dtype is given, the values are converted to it.
         '''
         self.num_samples = 0.0
         self.value = None
         self.max_window = max_window
+        self.accum_dtype = accum_dtype
 
     @contract(value='array', dt='>0')
     def update(self, value, dt=1.0):
+        if self.accum_dtype is not None:
+            value = np.asarray(value, dtype=self.accum_dtype)
         if self.value is None:
             self.value = value
         else:
-            self.value = weighted_average(self.value, float(self.num_samples),
-                                          value, float(dt))
+            self.value = _weighted_average(self.value, float(self.num_samples),
+                                           value, float(dt))
         self.num_samples += dt
         if self.max_window and self.num_samples > self.max_window:
             self.num_samples = self.max_window
 
+    def merge(self, other):
+        ''' Merges the samples seen by another ExpectationSlow. '''
+        assert isinstance(other, ExpectationSlow)
+        if other.value is None:
+            return
+        if self.value is None:
+            self.value = other.value.copy()
+        else:
+            self.value = _weighted_average(self.value, 
+                                           float(self.num_samples),
+                                           other.value, 
+                                           float(other.num_samples))
+        self.num_samples += other.num_samples
+        if self.max_window and self.num_samples > self.max_window:
+            self.num_samples = self.max_window
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, max_window=self.max_window,
+                          accum_dtype=dtype_name(self.accum_dtype),
+                          num_samples=self.num_samples)
+        if self.value is not None:
+            state['value'] = self.value
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        e = cls(max_window=state['max_window'],
+                accum_dtype=state['accum_dtype'])
+        e.num_samples = state['num_samples']
+        e.value = state.get('value')
+        return e
+
     def get_value(self):
         return self.value
 
@@ -35,6 +78,12 @@ class ExpectationSlow(ExpectationInterface):
 
 @contract(A='array', wA='>=0', B='array', wB='>=0')
 def weighted_average(A, wA, B, wB):
+    return _weighted_average(A, wA, B, wB)
+
+
+def _weighted_average(A, wA, B, wB):
+    # (not checked: the methods call this, so that fast mode skips the 
+    # contracts)
     mA = wA / (wA + wB)
     mB = wB / (wA + wB)
     return (mA * A + mB * B)
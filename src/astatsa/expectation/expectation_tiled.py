@@ -0,0 +1,150 @@
+from . import ExpectationInterface, contract, np
+from astatsa.utils import check_all_finite, contracts_bypassable
+from astatsa.utils.state import new_state, check_state
+import os
+import tempfile
+
+__all__ = ['ExpectationTiled']
+
+
+@contracts_bypassable
+class ExpectationTiled(ExpectationInterface):
+    ''' 
+        Expectation of a 2D quantity that is updated in tiles of rows,
+        optionally stored in a memory-mapped file. 
+        
+        Only the normalized mean is stored (one array, instead of the
+        accumulator and buffers of ExpectationFast), and a new sample 
+        can be given as a function returning its rows, so that it never 
+        needs to be materialized as a whole. The working set of an 
+        update is then O(tile_rows * ncols). 
+    '''
+
+    TILE_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, shape, max_window=None, directory=None,
+                 tile_rows=None, dtype='float64'):
+        ''' 
+            :param shape: Shape (nrows, ncols) of the quantity.
+            :param directory: If given, the mean is stored in a new 
+                file in this directory, which close() deletes.
+            :param tile_rows: Number of rows per tile; by default, tiles 
+                are about TILE_BYTES large.
+        '''
+        nrows, ncols = shape
+        self.max_window = max_window
+        self.accum_mass = 0.0
+        self.dtype = np.dtype(dtype)
+        if tile_rows is None:
+            row_bytes = max(1, ncols * self.dtype.itemsize)
+            tile_rows = max(1, ExpectationTiled.TILE_BYTES // row_bytes)
+        self.tile_rows = int(tile_rows)
+        self.directory = directory
+        if directory is None:
+            self.filename = None
+            self.value = np.zeros(shape, dtype=self.dtype)
+        else:
+            fd, self.filename = tempfile.mkstemp(prefix='astatsa-', 
+                                                 suffix='.dat', dir=directory)
+            os.close(fd)
+            self.value = np.memmap(self.filename, dtype=self.dtype, 
+                                   mode='w+', shape=shape)
+
+    def merge(self, other):
+        ''' Merges the samples seen by another ExpectationTiled. '''
+        assert isinstance(other, ExpectationTiled)
+        if other.accum_mass == 0:
+            return
+        self.update_rows(lambda i0, i1: np.array(other.value[i0:i1]),
+                         float(other.accum_mass))
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        return new_state(self, max_window=self.max_window,
+                         tile_rows=self.tile_rows, dtype=self.dtype.name,
+                         directory=self.directory,
+                         accum_mass=self.accum_mass, value=self.value)
+
+    @classmethod
+    def from_state(cls, state):
+        ''' 
+            Returns an instance with the given state. If the original 
+            was stored in a directory, the value is copied (by tiles) to
+            a new file there, so that the instance is backed by a file as
+            well; otherwise, it is not copied, so it can be a 
+            memory-mapped array. 
+        '''
+        check_state(state, cls)
+        value = state['value']
+        directory = state.get('directory')
+        shape = (0, 0) if directory is None else value.shape
+        e = cls(shape, max_window=state['max_window'], directory=directory,
+                tile_rows=state['tile_rows'], dtype=state['dtype'])
+        if directory is None:
+            e.value = value
+        else:
+            for i0 in range(0, value.shape[0], e.tile_rows):
+                e.value[i0:i0 + e.tile_rows] = value[i0:i0 + e.tile_rows]
+        e.accum_mass = state['accum_mass']
+        return e
+
+    @contract(value='array[RxC]', dt='float,>=0')
+    def update(self, value, dt=1.0):
+        check_all_finite(value)
+        self.update_rows(lambda i0, i1: value[i0:i1], dt)
+
+    def update_rows(self, rows, dt):
+        ''' 
+            Updates with a sample whose rows i0:i1 are returned by the
+            function rows(i0, i1).
+        '''
+        nrows = self.value.shape[0]
+        mass = self.accum_mass + dt
+        if mass == 0:
+            return
+        a = self.accum_mass / mass
+        b = dt / mass
+        for i0 in range(0, nrows, self.tile_rows):
+            i1 = min(nrows, i0 + self.tile_rows)
+            tile = self.value[i0:i1]
+            if a == 0:
+                tile[...] = rows(i0, i1)
+            else:
+                tile *= a
+                tile += b * rows(i0, i1)
+        self.accum_mass = mass
+        if self.max_window and self.accum_mass > self.max_window:
+            self.accum_mass = self.max_window
+
+    def get_value(self):
+        if self.accum_mass == 0:
+            raise ValueError('No value given yet.')
+        return self.value
+
+    def __call__(self):
+        return self.get_value()
+
+    def get_mass(self):
+        return self.accum_mass
+
+    def flush(self):
+        ''' Flushes the memory-mapped file, if any. '''
+        if self.filename is not None:
+            self.value.flush()
+
+    def close(self):
+        ''' 
+            Deletes the file created in the directory, if any; the 
+            instance cannot be used afterwards. 
+        '''
+        if self.filename is not None:
+            filename, self.filename = self.filename, None
+            self.value = None
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
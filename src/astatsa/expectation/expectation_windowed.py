@@ -0,0 +1,201 @@
+from . import ExpectationInterface, contract, np
+from astatsa.utils import contracts_bypassable, Validation
+from astatsa.utils.state import new_state, check_state, dtype_name
+
+__all__ = ['ExpectationWindowed']
+
+
+@contracts_bypassable
+class ExpectationWindowed(ExpectationInterface):
+    ''' 
+        Exact expectation over a sliding window, either of the last 
+        ``window_samples`` samples or of the most recent samples whose 
+        total mass (sum of dt) does not exceed ``window_time``. 
+        
+        The samples are kept in a preallocated ring buffer together with 
+        running sums, so that update() is O(1) amortized; the sums are 
+        recomputed from the buffer once every ``capacity`` updates to 
+        bound the floating point drift due to the subtractions.
+        
+        With window_time, the samples with dt=0 are not kept: they do 
+        not change the sums, and they would never be evicted.
+    '''
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, window_samples=None, window_time=None,
+                 accum_dtype=None, validation='always'):
+        ''' 
+            accum_dtype: dtype of the buffer and of the sums; by default,
+            the one of value * dt.
+            
+            validation: when to check that the values are finite 
+            (see Validation).
+        '''
+        if (window_samples is None) == (window_time is None):
+            msg = 'Specify exactly one of window_samples and window_time.'
+            raise ValueError(msg)
+        if window_samples is not None and window_samples < 1:
+            raise ValueError('Invalid window_samples %r' % window_samples)
+        if window_time is not None and not window_time > 0:
+            raise ValueError('Invalid window_time %r' % window_time)
+        self.window_samples = window_samples
+        self.window_time = window_time
+        self.accum_dtype = accum_dtype
+        self.validation = Validation.from_policy(validation)
+        self.values = None
+        self.dts = None
+        self.start = 0  # index of the oldest sample
+        self.count = 0
+        self.accum = None
+        self.accum_mass = 0.0
+        self.updates_since_recompute = 0
+        self.needs_normalization = True
+        self.result = None
+
+    @contract(value='array', dt='float,>=0')
+    def update(self, value, dt=1.0):
+        self.validation.check_update(value)
+
+        if self.values is None:
+            if self.window_samples is not None:
+                capacity = self.window_samples
+            else:
+                capacity = ExpectationWindowed.INITIAL_CAPACITY
+            dtype = self.accum_dtype or np.result_type(value, 1.0)
+            self.values = np.zeros((capacity,) + value.shape, dtype=dtype)
+            self.dts = np.zeros(capacity)
+            self.accum = np.zeros(value.shape, dtype=dtype)
+            self.result = np.empty_like(self.accum)
+            self.buf = np.empty_like(self.accum)
+        elif value.shape != self.accum.shape:
+            raise ValueError('Value shape changed: %s -> %s' % 
+                             (self.accum.shape, value.shape))
+
+        if dt == 0 and self.window_time is not None:
+            return
+
+        capacity = self.dts.shape[0]
+        if self.count == capacity:
+            if self.window_samples is not None:
+                self._evict_oldest()
+            else:
+                self._grow()
+                capacity = self.dts.shape[0]
+
+        i = (self.start + self.count) % capacity
+        self.values[i] = value
+        self.dts[i] = dt
+        self.count += 1
+        # in place, so that update() does not allocate in steady state
+        self.accum += np.multiply(self.values[i], dt, self.buf)
+        self.accum_mass += dt
+
+        if self.window_time is not None:
+            while self.count > 1 and self.accum_mass > self.window_time:
+                self._evict_oldest()
+
+        self.needs_normalization = True
+        self.updates_since_recompute += 1
+        if self.updates_since_recompute >= capacity:
+            self._recompute_sums()
+
+    def merge(self, other):
+        ''' 
+            Not supported: the samples of two windows cannot be 
+            interleaved in time after the fact. 
+        '''
+        msg = 'ExpectationWindowed does not support merge().'
+        raise NotImplementedError(msg)
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, window_samples=self.window_samples,
+                          window_time=self.window_time,
+                          accum_dtype=dtype_name(self.accum_dtype),
+                          validation=self.validation.policy,
+                          validation_interval=self.validation.interval,
+                          start=self.start, count=self.count,
+                          accum_mass=self.accum_mass,
+                          updates_since_recompute=self.updates_since_recompute)
+        if self.values is not None:
+            state['values'] = self.values
+            state['dts'] = self.dts
+            state['accum'] = self.accum
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        validation = Validation(state.get('validation', 'always'),
+                                state.get('validation_interval', 16))
+        e = cls(window_samples=state['window_samples'],
+                window_time=state['window_time'],
+                accum_dtype=state['accum_dtype'], validation=validation)
+        if 'values' in state:
+            e.values = state['values']
+            e.dts = state['dts']
+            e.accum = state['accum']
+            e.result = np.empty_like(e.accum)
+            e.buf = np.empty_like(e.accum)
+            e.start = state['start']
+            e.count = state['count']
+            e.accum_mass = state['accum_mass']
+            e.updates_since_recompute = state['updates_since_recompute']
+        return e
+
+    def _evict_oldest(self):
+        i = self.start
+        dt = self.dts[i]
+        self.accum -= np.multiply(self.values[i], dt, self.buf)
+        self.accum_mass -= dt
+        self.dts[i] = 0
+        self.start = (i + 1) % self.dts.shape[0]
+        self.count -= 1
+
+    def _grow(self):
+        ''' Doubles the capacity, unrolling the ring. '''
+        capacity = self.dts.shape[0]
+        order = (self.start + np.arange(self.count)) % capacity
+        values = np.zeros((2 * capacity,) + self.values.shape[1:],
+                          dtype=self.values.dtype)
+        dts = np.zeros(2 * capacity)
+        values[:self.count] = self.values[order]
+        dts[:self.count] = self.dts[order]
+        self.values = values
+        self.dts = dts
+        self.start = 0
+
+    def _recompute_sums(self):
+        # evicted slots have zero weight, so we can sum over all of them
+        flat = self.values.reshape((self.dts.shape[0], -1))
+        if self.accum.dtype == np.result_type(self.dts, flat):
+            np.dot(self.dts, flat, out=self.accum.reshape(-1))
+        else:
+            self.accum[...] = np.dot(self.dts, flat).reshape(self.accum.shape)
+        self.accum_mass = float(np.sum(self.dts))
+        self.updates_since_recompute = 0
+
+    def get_value(self):
+        if self.accum is None:
+            raise ValueError('No value given yet.')
+        if self.needs_normalization:
+            if self.accum_mass > 0:
+                ratio = 1.0 / self.accum_mass
+            else:
+                ratio = 1.0
+            np.multiply(ratio, self.accum, self.result)
+            self.validation.check_read(self.result)
+            self.needs_normalization = False
+        return self.result
+
+    def __call__(self):
+        return self.get_value()
+
+    def get_mass(self):
+        return self.accum_mass
+
+    def get_num_samples(self):
+        ''' Returns the number of samples currently in the window. '''
+        return self.count
@@ -1,10 +1,12 @@
 from abc import abstractmethod
 from contracts import contract, ContractsMeta
+from astatsa.utils import contracts_bypassable
 
 
 __all__ = ['ExpectationInterface']
 
 
+@contracts_bypassable
 class ExpectationInterface():
     
     __metaclass__ = ContractsMeta
@@ -14,6 +16,18 @@ class ExpectationInterface():
     def update(self, value, dt=1.0):
         pass
 
+    @contract(values='array[Nx...]', dts='None|array[N](>=0)')
+    def update_batch(self, values, dts=None):
+        ''' 
+            Equivalent to calling update(values[i], dts[i]) for each i.
+            If dts is None, every sample has unit weight.
+            
+            Subclasses can override this with a vectorized version.
+        '''
+        for i in range(values.shape[0]):
+            dt = 1.0 if dts is None else float(dts[i])
+            self.update(values[i], dt)
+
     @abstractmethod
     @contract(returns='array')
     def get_value(self):
@@ -0,0 +1,50 @@
+from astatsa.expectation import (ExpectationFast, ExpectationSlow,
+    ExpectationFaster)
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def check_batch_equals_sequential(exp_class, shape, N, max_window=None):
+    values = np.random.randn(N, *shape)
+    dts = np.random.rand(N) + 0.01
+
+    if max_window is None:
+        e1 = exp_class()
+        e2 = exp_class()
+    else:
+        e1 = exp_class(max_window=max_window)
+        e2 = exp_class(max_window=max_window)
+
+    for i in range(N):
+        e1.update(values[i], float(dts[i]))
+
+    # split in two batches to exercise the non-empty state
+    h = N // 2
+    e2.update_batch(values[:h], dts[:h])
+    e2.update_batch(values[h:], dts[h:])
+
+    assert_allclose(e1.get_value(), e2.get_value())
+    assert_allclose(e1.get_mass(), e2.get_mass())
+
+
+def test_batch():
+    for exp_class in [ExpectationSlow, ExpectationFast, ExpectationFaster]:
+        for N in [1, 2, 10, 1000]:
+            check_batch_equals_sequential(exp_class, (3, 2), N)
+
+
+def test_batch_max_window():
+    for exp_class in [ExpectationSlow, ExpectationFast]:
+        for max_window in [0.5, 3, 50, 200]:
+            check_batch_equals_sequential(exp_class, (4,), 500, max_window)
+
+
+def test_batch_unit_weights():
+    e1 = ExpectationFast()
+    e2 = ExpectationFast()
+    values = np.random.randn(20, 3)
+    for v in values:
+        e1.update(v)
+    e2.update_batch(values)
+    assert_allclose(e1.get_value(), e2.get_value())
+    assert_allclose(e1.get_mass(), e2.get_mass())
@@ -1,8 +1,12 @@
 from astatsa.expectation import ExpectationFast
+from astatsa.expectation_weighted import ExpectationWeighted
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.mean_variance import MeanVariance
 from astatsa.utils import assert_allclose
+from functools import partial
 import numpy as np
 
-def check_my_doubt(exp_class):
+def check_my_doubt(exp_class, dtype='float64', rtol=1e-7):
     values = [100.0, 200.0]
     mean = 150.0
     
@@ -11,7 +15,7 @@ def check_my_doubt(exp_class):
         samples = []
         for v in values:
             samples.extend([v] * nd)
-        samples = np.array(samples)
+        samples = np.array(samples, dtype=dtype)
     
         ex = exp_class()        
         for s in samples:
@@ -24,9 +28,123 @@ def check_my_doubt(exp_class):
         result = ex.get_value()
         # print('accum: %10.4f  mass: %10.4f ' % (ex.accum, ex.accum_mass))
                     
-        assert_allclose(result, mean)
+        assert_allclose(result, mean, rtol=rtol)
         
     
 
 def test_fast():
     check_my_doubt(ExpectationFast)
+
+
+def test_fast_dtypes():
+    settings = [
+        dict(accum_dtype='float64'),
+        dict(accum_dtype='float64', compensated=True),
+        dict(accum_dtype='float32', compensated=True),
+    ]
+    for kwargs in settings:
+        check_my_doubt(partial(ExpectationFast, **kwargs), dtype='float32')
+    check_my_doubt(partial(ExpectationFast, accum_dtype='float32'),
+                   dtype='float32', rtol=1e-6)
+
+
+def test_compensated_float32():
+    # 0.1 is not representable, and the rounding errors of a float32 
+    # running sum accumulate; the compensated sum does not drift.
+    x = np.array([0.1], dtype='float32')
+    plain = ExpectationFast(accum_dtype='float32')
+    compensated = ExpectationFast(accum_dtype='float32', compensated=True)
+    for _ in range(5000):
+        plain.update(x)
+        compensated.update(x)
+    assert compensated.accum.dtype == np.float32
+    assert_allclose(compensated.get_value(), x, rtol=1e-7)
+    error_plain = abs(plain.get_value()[0] - x[0])
+    error_compensated = abs(compensated.get_value()[0] - x[0])
+    assert error_compensated < error_plain
+
+
+def test_renormalize_interval():
+    for interval in [1, 7, None]:
+        for compensated in [False, True]:
+            check_my_doubt(partial(ExpectationFast,
+                                   renormalize_interval=interval,
+                                   compensated=compensated))
+        check_my_doubt(partial(ExpectationFast, renormalize_interval=interval,
+                               accum_dtype='float32', compensated=True),
+                       dtype='float32')
+
+
+def test_renormalize_headroom():
+    # The float32 sum of these would overflow after ~340 samples;
+    # rescaling it by powers of two keeps it finite and exact.
+    x = np.array([1e36, -3e36, 1.0], dtype='float32')
+    for interval in [1, 16]:
+        e = ExpectationFast(accum_dtype='float32', renormalize_interval=interval)
+        for _ in range(1000):
+            e.update(x)
+        assert e.scale < 1
+        assert_allclose(e.get_value(), x, rtol=1e-5)
+        assert_allclose(e.get_mass(), 1000)
+
+    e = ExpectationFast(accum_dtype='float32', renormalize_interval=None)
+    with np.errstate(over='ignore'):
+        for _ in range(1000):
+            e.update(x)
+    assert not np.all(np.isfinite(e.get_value()))
+
+    # the same for tiny values, close to underflow
+    x = np.array([1e-300, 3e-300])
+    e = ExpectationFast(renormalize_interval=4)
+    for _ in range(100):
+        e.update(x, dt=1e-5)
+    assert e.scale > 1
+    assert_allclose(e.get_value(), x)
+
+
+def test_renormalize_batch():
+    # the batch path and max_window clamping see the scale
+    X = np.array([[1e36, 2e36]] * 500, dtype='float32')
+    e = ExpectationFast(accum_dtype='float32', renormalize_interval=1)
+    for i in range(0, 500, 50):
+        e.update_batch(X[i:i + 50])
+    assert_allclose(e.get_value(), X[0], rtol=1e-6)
+    e = ExpectationFast(accum_dtype='float32', renormalize_interval=1,
+                        max_window=300.0)
+    for i in range(0, 500, 50):
+        e.update_batch(X[i:i + 50])
+        e.update(X[0])
+    assert_allclose(e.get_value(), X[0], rtol=1e-6)
+
+
+def updated_accumulators(X, **kwargs):
+    mv = MeanVariance(**kwargs)
+    mc = MeanCovariance(**kwargs)
+    ew = ExpectationWeighted(**kwargs)
+    w = np.array([1.0, 0.5], dtype='float32')
+    for x in X:
+        mv.update(x)
+        mc.update(x)
+        ew.update(x, w)
+    return np.vstack((mv.get_mean(), mc.get_mean(), ew.get_value(),
+                      mv.get_var(), np.diag(mc.get_covariance())))
+
+
+def test_accumulators_accuracy():
+    # samples alternating between two values, given as float32
+    a, b = np.float32(100.1), np.float32(200.3)
+    samples = np.array([a, b] * 1000, dtype='float32')
+    X = np.vstack((samples, samples[::-1])).T.copy()
+    mean = np.mean(X.astype('float64'), axis=0)
+
+    # the float32 results are compared with the float64 ones, as the 
+    # variance of the per-sample update is not exactly the sample variance
+    reference = updated_accumulators(X, accum_dtype='float64')
+    assert_allclose(reference[:3], [mean] * 3, rtol=1e-7)
+    compensated = updated_accumulators(X, accum_dtype='float32', 
+                                       compensated=True)
+    assert_allclose(compensated, reference, rtol=1e-6)
+    plain = updated_accumulators(X, accum_dtype='float32')
+    error_plain = np.abs(plain - reference).max(axis=1)
+    error_compensated = np.abs(compensated - reference).max(axis=1)
+    assert np.all(error_compensated < error_plain)
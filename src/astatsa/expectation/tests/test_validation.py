@@ -0,0 +1,101 @@
+from astatsa.expectation import ExpectationFast, ExpectationWindowed
+from astatsa.expectation_weighted import ExpectationWeighted
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.mean_variance import MeanVariance
+from astatsa.utils import Validation, all_finite
+import numpy as np
+
+
+def raises_value_error(f):
+    try:
+        f()
+    except ValueError:
+        return True
+    return False
+
+
+def test_all_finite():
+    assert all_finite(np.array([1.0, 2.0]))
+    assert not all_finite(np.array([1.0, np.nan]))
+    assert not all_finite(np.array([np.inf, -np.inf]))
+    # the sum overflows, but the values are finite (without warnings)
+    with np.errstate(all='raise'):
+        assert all_finite(np.array([1e308, 1e308]))
+        assert not all_finite(np.array([np.inf, -np.inf]))
+
+
+def test_validation_policies():
+    bad = np.array([1.0, np.nan])
+    good = np.array([1.0, 2.0])
+    for cls in [ExpectationFast,
+                lambda validation: ExpectationWindowed(window_samples=5,
+                                                       validation=validation)]:
+        e = cls(validation='always')
+        assert raises_value_error(lambda: e.update(bad))
+
+        e = cls(validation='never')
+        e.update(bad)
+        assert np.isnan(e.get_value()[1])
+
+        e = cls(validation='on_read')
+        e.update(good)
+        e.update(bad)
+        assert raises_value_error(e.get_value)
+
+        e = cls(validation=Validation('sampled', interval=3))
+        e.update(bad)
+        e.update(bad)
+        assert raises_value_error(lambda: e.update(bad))
+
+
+def test_validation_weighted():
+    w = np.array([1.0, 0.0])
+    e = ExpectationWeighted()
+    assert raises_value_error(lambda: e.update(np.array([1.0, np.nan]), w))
+    assert raises_value_error(lambda: e.update(np.ones(2),
+                                               np.array([1.0, np.inf])))
+    e = ExpectationWeighted(validation='on_read')
+    e.update(np.array([1.0, np.nan]), w)
+    assert raises_value_error(e.get_value)
+
+
+def test_validation_mean_covariance():
+    mc = MeanCovariance(validation='never')
+    mc.update(np.array([1.0, np.nan]))
+    mc = MeanCovariance()
+    assert raises_value_error(lambda: mc.update(np.array([1.0, np.nan])))
+    try:
+        Validation('sometimes')
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
+
+
+def test_validation_derived():
+    # the accumulators of the deviations do not check them again
+    mc = MeanCovariance()
+    assert mc.mean_accum.validation.policy == 'never'
+    assert mc.covariance_accum.validation.policy == 'never'
+    mc = MeanCovariance(validation='on_read')
+    mc.update(np.array([1.0, np.nan]))
+    assert raises_value_error(mc.get_covariance)
+    mv = MeanVariance()
+    assert mv.Edx2.validation.policy == 'never'
+    assert raises_value_error(lambda: mv.update(np.array([1.0, np.nan])))
+    assert mv.num_samples == 0
+
+
+def test_validation_rejected_unchanged():
+    # a rejected sample does not change the state
+    X = np.random.randn(10, 2)
+    bad = np.array([1.0, np.nan])
+    mc = MeanCovariance()
+    mc.update_batch(X)
+    assert raises_value_error(lambda: mc.update(bad))
+    assert raises_value_error(lambda: mc.update_batch(np.vstack((X, bad))))
+    assert raises_value_error(lambda: mc.update(np.ones(3)))
+    assert mc.get_num_samples() == 10
+    assert np.all(mc.get_maximum() == X.max(axis=0))
+    assert np.all(mc.get_minimum() == X.min(axis=0))
+    assert np.allclose(mc.get_mean(), X.mean(axis=0))
@@ -0,0 +1,87 @@
+from astatsa.expectation import ExpectationWindowed
+from astatsa.mean_variance import MeanVariance
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def test_window_samples():
+    K = 7
+    values = np.random.randn(100, 3)
+    dts = np.random.rand(100) + 0.1
+    e = ExpectationWindowed(window_samples=K)
+    for i in range(100):
+        e.update(values[i], float(dts[i]))
+        lo = max(0, i + 1 - K)
+        expected = np.average(values[lo:i + 1], axis=0, weights=dts[lo:i + 1])
+        assert_allclose(e.get_value(), expected)
+        assert_allclose(e.get_mass(), dts[lo:i + 1].sum())
+
+
+def test_window_time():
+    T = 5.0
+    values = np.random.randn(200, 2)
+    dts = np.random.rand(200)
+    e = ExpectationWindowed(window_time=T)
+    for i in range(200):
+        e.update(values[i], float(dts[i]))
+        # most recent samples with total mass <= T
+        lo = i
+        while lo > 0 and dts[lo - 1:i + 1].sum() <= T:
+            lo -= 1
+        expected = np.average(values[lo:i + 1], axis=0, weights=dts[lo:i + 1])
+        assert_allclose(e.get_value(), expected)
+        assert e.get_num_samples() == i + 1 - lo
+
+
+def test_window_drift():
+    # large offsets make the running subtraction lose precision
+    e = ExpectationWindowed(window_samples=10)
+    for i in range(10000):
+        e.update(np.array([1e8 * (i % 2) + 0.5]))
+    for i in range(10):
+        e.update(np.array([1.0]))
+    assert_allclose(e.get_value(), [1.0], rtol=1e-12)
+
+
+def test_mean_variance_exact_window():
+    # (with a trend, the mean of the window moves away from the first 
+    # samples)
+    x = np.random.randn(300, 4) + np.linspace(0, 30, 300)[:, np.newaxis]
+    last = x[-50:]
+    for preallocate in [False, True]:
+        mv = MeanVariance(max_window=50, exact_window=True,
+                          preallocate=preallocate)
+        for i in range(300):
+            mv.update(x[i])
+        assert_allclose(mv.get_mean(), last.mean(axis=0))
+        assert_allclose(mv.get_var(), last.var(axis=0))
+        assert_allclose(mv.get_std_dev(), last.std(axis=0))
+
+    C = np.cov(last.T, bias=True)
+    for structure in ['full', 'diagonal']:
+        mc = MeanCovariance(max_window=50, exact_window=True,
+                            structure=structure)
+        mc.update_batch(x)
+        assert_allclose(mc.get_mean(), last.mean(axis=0))
+        expected = C if structure == 'full' else np.diag(C)
+        assert_allclose(mc.get_covariance(), expected)
+    mc = MeanCovariance(max_window=50, exact_window=True,
+                        blocks=[[0, 2], [1, 3]])
+    mc.update_batch(x)
+    for idx, block in zip([[0, 2], [1, 3]], mc.get_covariance().matrices):
+        assert_allclose(block, C[np.ix_(idx, idx)])
+
+
+def test_window_time_zero_dt():
+    # the samples with dt=0 do not fill the buffer
+    e = ExpectationWindowed(window_time=3.0)
+    e.update(np.array([1.0]), 0.0)
+    e.update(np.array([2.0]), 1.0)
+    for _ in range(1000):
+        e.update(np.array([5.0]), 0.0)
+    e.update(np.array([4.0]), 1.0)
+    assert e.dts.shape[0] == ExpectationWindowed.INITIAL_CAPACITY
+    assert e.get_num_samples() == 2
+    assert_allclose(e.get_value(), [3.0])
+    assert_allclose(e.get_mass(), 2.0)
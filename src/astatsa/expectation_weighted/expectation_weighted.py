@@ -1,68 +1,190 @@
 from astatsa.expectation_weighted.interface import ExpectationWeightedInterface
-from astatsa.utils.np_comparisons import check_all_finite
+from astatsa.utils.validation import Validation
+from astatsa.utils.summation import compensated_add, compensation_scratch
+from astatsa.utils.cache import readonly
+from astatsa.utils.fast_mode import contracts_bypassable
+from astatsa.utils.state import new_state, check_state, dtype_name
 from contracts import contract
 import numpy as np
-import warnings
  
  
 __all__ = ['ExpectationWeighted']
 
 
+@contracts_bypassable
 class ExpectationWeighted(ExpectationWeightedInterface):
     ''' 
         This operator allows, for each time step, to give a different weight
         to each element. The weight tensor should have the same shape as the value.
+        
+        The updates and the getters work in buffers allocated at the first
+        update. The getters return read-only views of these buffers, which
+        are overwritten after the following updates (and, for 
+        get_value(), by a call with a different fill_value): copy them 
+        to keep them.
      '''
  
-    def __init__(self):
+    def __init__(self, accum_dtype='float64', compensated=False,
+                 validation='always'):
+        ''' 
+            accum_dtype: dtype of the accumulators.
+            compensated: use Neumaier (Kahan) summation for the 
+            accumulators, so that float32 storage stays accurate.
+            validation: when to check that the values and weights are 
+            finite (see Validation).
+        '''
+        self.accum_dtype = accum_dtype
+        self.compensated = compensated
+        self.validation = Validation.from_policy(validation)
         self.mass = None
         self.accum = None
+        self.mass_compensation = None
+        self.accum_compensation = None
          
         self._result = None
+        # the fill_value used for _result
+        self._result_fill = None
          
     def merge(self, other):
-        warnings.warn('To test')
+        ''' Merges the samples seen by another ExpectationWeighted. '''
         assert isinstance(other, ExpectationWeighted)
-        self.update(other.get_value(fill_value=0), other.get_mass())
+        if other.accum is None:
+            return
+        if self.accum is None:
+            self._initialize(other._total_accum(), other._total_mass())
+        else:
+            if self.accum.shape != other.accum.shape:
+                raise ValueError('Cannot merge shapes %s and %s' % 
+                                 (self.accum.shape, other.accum.shape))
+            self._add(other._total_accum(), other._total_mass())
+        self._invalidate()
         
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, accum_dtype=dtype_name(self.accum_dtype),
+                          compensated=self.compensated,
+                          validation=self.validation.policy,
+                          validation_interval=self.validation.interval)
+        if self.accum is not None:
+            state['accum'] = self.accum
+            state['mass'] = self.mass
+            if self.compensated:
+                state['accum_compensation'] = self.accum_compensation
+                state['mass_compensation'] = self.mass_compensation
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        validation = Validation(state.get('validation', 'always'),
+                                state.get('validation_interval', 16))
+        e = cls(accum_dtype=state['accum_dtype'],
+                compensated=state['compensated'], validation=validation)
+        if 'accum' in state:
+            e.accum = state['accum']
+            e.mass = state['mass']
+            if e.compensated:
+                e.accum_compensation = state['accum_compensation']
+                e.mass_compensation = state['mass_compensation']
+            e._allocate_buffers()
+        return e
+
     @contract(value='array,shape(x)', weight='array(>=0),shape(x)')
     def update(self, value, weight):
         # Todo: check that they are either finite or the weight is zero
-        check_all_finite(value)
-        check_all_finite(weight)
         assert value.shape == weight.shape
-         
         # If first time
         if self.accum is None:
-            self.accum = (value * weight).astype('float64')
-            self.mass = weight.astype('float64')
-            self._result = None
+            weighted = value * weight
+            # a single check: the product is not finite if either is not
+            self.validation.check_update(weighted)
+            self._initialize(weighted, weight)
+        else:
+            weighted = np.multiply(value, weight, self.buf)
+            self.validation.check_update(weighted)
+            self._add(weighted, weight)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._result = None
+        self._result_fill = None
+
+    def _initialize(self, accum, mass):
+        self.accum = np.array(accum, dtype=self.accum_dtype)
+        self.mass = np.array(mass, dtype=self.accum_dtype)
+        if self.compensated:
+            self.accum_compensation = np.zeros_like(self.accum)
+            self.mass_compensation = np.zeros_like(self.mass)
+        self._allocate_buffers()
+
+    def _allocate_buffers(self):
+        self.buf = np.empty_like(self.accum)
+        self.result = np.empty_like(self.accum)
+        self.nonzero = np.empty(self.accum.shape, dtype=bool)
+        if self.compensated:
+            self.scratch = compensation_scratch(self.accum)
+            self.total_accum = np.empty_like(self.accum)
+            self.total_mass = np.empty_like(self.mass)
+
+    def _add(self, accum, mass):
+        if self.compensated:
+            compensated_add(self.accum, self.accum_compensation, accum,
+                            self.scratch)
+            compensated_add(self.mass, self.mass_compensation, mass,
+                            self.scratch)
         else:
-            self.accum += value * weight
-            self.mass += weight
-            self._result = None
+            self.accum += accum
+            self.mass += mass
+
+    def _total_accum(self):
+        if self.compensated:
+            return np.add(self.accum, self.accum_compensation,
+                          self.total_accum)
+        return self.accum
+
+    def _total_mass(self):
+        if self.compensated:
+            return np.add(self.mass, self.mass_compensation, self.total_mass)
+        return self.mass
  
     def get_value(self, fill_value=np.nan):
-        """ Returns the value of the expectation. Raises ValueError if never updated. """
+        """ 
+            Returns the value of the expectation, with fill_value where
+            the mass is 0. Raises ValueError if never updated. 
+            
+            The result is a view of a buffer shared by all the fill 
+            values: a call with a different one overwrites the arrays
+            returned before.
+        """
         if self.accum is None:
             msg = 'No value given yet.'
             raise ValueError(msg)
  
-        if self._result is not None:
-            return self._result
-        
-        self._result = self._compute_value(fill_value)
+        if self._result is None or not same_fill(fill_value, 
+                                                 self._result_fill):
+            self._result = readonly(self._compute_value(fill_value))
+            self._result_fill = fill_value
         return self._result
     
     # @contract(returns='finite')
     def _compute_value(self, fill_value):
-        mass = self.mass.copy()
-        # set to one the mass
-        zeros = self.mass == 0
-        mass[zeros] = 1
-        result = self.accum / mass
-        result[zeros] = fill_value 
-        return result.copy()
+        self.validation.check_read(self.accum, self.mass)
+        mass = self._total_mass()
+        np.greater(mass, 0, self.nonzero)
+        self.result.fill(fill_value)
+        np.divide(self._total_accum(), mass, self.result, where=self.nonzero)
+        return self.result
  
     def get_mass(self):
-        return self.mass.copy()
+        if self.accum is None:
+            msg = 'No value given yet.'
+            raise ValueError(msg)
+        return readonly(self._total_mass())
+
+
+def same_fill(a, b):
+    ''' Whether two fill values are the same, considering NaN. '''
+    if a is None or b is None:
+        return a is b
+    return a == b or (np.isnan(a) and np.isnan(b))
@@ -33,3 +33,42 @@ def test_weighted_4():
     assert_allclose([23, 101], ex.get_mass())
 
 
+
+def test_weighted_float32_compensated():
+    ex = ExpectationWeighted(accum_dtype='float32', compensated=True)
+    x = np.array([0.1, 0.2], dtype='float32')
+    w = np.array([1, 0.5], dtype='float32')
+    for _ in range(3000):
+        ex.update(x, w)
+    assert ex.accum.dtype == np.float32
+    assert_allclose(x, ex.get_value(), rtol=1e-7)
+    assert_allclose([3000, 1500], ex.get_mass(), rtol=1e-7)
+
+
+def test_weighted_fill_value():
+    ex = ExpectationWeighted()
+    ex.update(np.array([1.0, 2.0]), np.array([1.0, 0]))
+    assert np.isnan(ex.get_value()[1])
+    # the cached result depends on the fill value
+    assert_allclose([1, 42], ex.get_value(42))
+    assert_allclose([1, -1], ex.get_value(fill_value=-1))
+    assert ex.get_value(-1) is ex.get_value(-1)
+    assert np.isnan(ex.get_value()[1])
+    # the results share the buffer: copy them to keep them
+    a = ex.get_value(42)
+    a_copy = a.copy()
+    b = ex.get_value(-1)
+    assert_allclose([1, -1], a)
+    assert_allclose([1, 42], a_copy)
+    assert_allclose([1, -1], b)
+
+
+def test_weighted_readonly():
+    for compensated in [False, True]:
+        ex = ExpectationWeighted(compensated=compensated)
+        ex.update(np.array([1.0, 2.0]), np.array([1.0, 3.0]))
+        for x in [ex.get_value(), ex.get_mass()]:
+            assert not x.flags.writeable
+        ex.update(np.array([3.0, 2.0]), np.array([1.0, 1.0]))
+        assert_allclose([2, 2], ex.get_value())
+        assert_allclose([2, 4], ex.get_mass())
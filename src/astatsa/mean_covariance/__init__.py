@@ -1,2 +1,4 @@
 from .interface import *
-from .imp import *
\ No newline at end of file
+from .imp import *
+from .sketch import *
+from .block_diagonal import *
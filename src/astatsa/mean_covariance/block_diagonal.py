@@ -0,0 +1,53 @@
+import numpy as np
+
+__all__ = ['BlockDiagonal']
+
+
+class BlockDiagonal(object):
+    ''' 
+        A n x n matrix that is zero outside of some diagonal blocks. 
+        
+        blocks[j] is the array of the indices of the j-th block and 
+        matrices[j] the corresponding square matrix. The blocks are
+        disjoint, but they do not need to cover all the indices.
+    '''
+
+    def __init__(self, n, blocks, matrices):
+        self.shape = (n, n)
+        self.blocks = blocks
+        self.matrices = matrices
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, j):
+        return self.matrices[j]
+
+    def map(self, f):
+        ''' Returns a BlockDiagonal with f() applied to each block. '''
+        return BlockDiagonal(self.shape[0], self.blocks,
+                             [f(M) for M in self.matrices])
+
+    def dot(self, x):
+        ''' Multiplies by a vector or by a (n, m) matrix. '''
+        x = np.asarray(x)
+        y = np.zeros(x.shape, dtype=np.result_type(x, 1.0))
+        for idx, M in zip(self.blocks, self.matrices):
+            y[idx] = np.dot(M, x[idx])
+        return y
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def get_diagonal(self):
+        d = np.zeros(self.shape[0])
+        for idx, M in zip(self.blocks, self.matrices):
+            d[idx] = M.diagonal()
+        return d
+
+    def todense(self):
+        ''' Returns the n x n array; O(n^2) memory. '''
+        A = np.zeros(self.shape)
+        for idx, M in zip(self.blocks, self.matrices):
+            A[np.ix_(idx, idx)] = M
+        return A
@@ -2,30 +2,50 @@ import numpy as np
 
 
 
-def cov2corr(covariance, zero_diagonal=False):
+def cov2corr(covariance, zero_diagonal=False, out=None, inplace=False,
+             block_rows=None):
     ''' 
     Compute the correlation matrix from the covariance matrix.
     By convention, if the variance of a variable is 0, its correlation is 0 
     with the other, and self-corr is 1. (so the diagonal is always 1).
     
     If zero_diagonal = True, the diagonal is set to 0 instead of 1. 
+    
+    The rows and columns are scaled by broadcasting, one block of 
+    block_rows rows at a time, so that, with out or inplace, the only
+    extra memory is O(n). The output can be a memory-mapped array.
 
     :param zero_diagonal: Whether to set the (noninformative) diagonal to zero.
     :param covariance: A 2D numpy array.
+    :param out: Preallocated array for the result.
+    :param inplace: Whether to overwrite covariance with the result.
+    :param block_rows: Number of rows processed at a time (default: all).
     :return: correlation: The exctracted correlation.
     
     '''
     # TODO: add checks
-    outer = np.multiply.outer
-
+    n = covariance.shape[0]
     sigma = np.sqrt(covariance.diagonal())
     sigma[sigma == 0] = 1
     one_over = 1.0 / sigma
-    M = outer(one_over, one_over)
-    correlation = covariance * M
+
+    if inplace:
+        if out is not None:
+            raise ValueError('Cannot give both out and inplace=True.')
+        out = covariance
+    elif out is None:
+        out = np.empty(covariance.shape, 
+                       dtype=np.result_type(covariance, one_over))
+    if block_rows is None:
+        block_rows = max(n, 1)
+
+    for i0 in range(0, n, block_rows):
+        i1 = min(n, i0 + block_rows)
+        block = out[i0:i1]
+        np.multiply(covariance[i0:i1], one_over[i0:i1, np.newaxis], block)
+        np.multiply(block, one_over, block)
 
     if zero_diagonal:
-        for i in range(covariance.shape[0]):
-            correlation[i, i] = 0
+        np.fill_diagonal(out, 0)
 
-    return correlation
+    return out
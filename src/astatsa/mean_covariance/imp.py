@@ -10,98 +10,788 @@
 
 import numpy as np
 from numpy.linalg.linalg import pinv, LinAlgError
-import warnings
-from astatsa.expectation import Expectation
-from astatsa.utils import outer
+from astatsa.expectation import (Expectation, ExpectationWindowed,
+    ExpectationTiled)
+from astatsa.utils import (outer, DerivedCache, readonly, 
+    contracts_bypassable, Validation)
+from astatsa.utils.state import (new_state, check_state, nest_state,
+    unnest_state, dtype_name)
 from astatsa.mean_covariance.cov2corr_imp import cov2corr
+from astatsa.mean_covariance.block_diagonal import BlockDiagonal
 
 
+def check_blocks(blocks):
+    ''' 
+        Returns the blocks as arrays of indices; raises ValueError if
+        they are not disjoint lists of non-negative integers.
+    '''
+    result = []
+    for b in blocks:
+        idx = np.asarray(b)
+        if idx.size == 0:
+            idx = idx.astype('int')
+        if idx.ndim != 1 or idx.dtype.kind not in 'iu':
+            raise ValueError('Invalid block %r: expected a list of indices.'
+                             % (b,))
+        if np.any(idx < 0):
+            raise ValueError('Invalid block %r: negative index.' % (b,))
+        result.append(idx.astype('int'))
+    if result:
+        indices = np.concatenate(result)
+        if np.unique(indices).size != indices.size:
+            raise ValueError('The blocks are not disjoint: %s.' % 
+                             [list(b) for b in result])
+    return result
+
+
+def outer_into(v, out):
+    ''' 
+        Writes the outer product of v with itself in out, as a matrix 
+        product: unlike np.multiply.outer, it does not allocate buffers.
+    '''
+    n = v.size
+    np.dot(v.reshape(n, 1), v.reshape(1, n), out=out.reshape(n, n))
+    return out
+
+
+@contracts_bypassable
 class MeanCovariance(object):
     ''' Computes mean and covariance of a quantity '''
 
-    def __init__(self, max_window=None):
-        self.mean_accum = Expectation(max_window)
-        self.covariance_accum = Expectation(max_window)
+    def __init__(self, max_window=None, exact_window=False,
+                 storage_dir=None, tile_rows=None, accum_dtype=None,
+                 compensated=False, structure='full', blocks=None,
+                 validation='always', preallocate=False):
+        ''' 
+            By default, max_window only clamps the mass of the 
+            accumulators, which gives an exponential forgetting. 
+            If exact_window is True, the statistics are computed over
+            the most recent samples with total mass at most max_window.
+            
+            If storage_dir is given, the n x n covariance is kept in a 
+            memory-mapped file in that directory and updated in tiles of
+            tile_rows rows (see ExpectationTiled), so that the working 
+            set in RAM is O(tile_rows * n). The values must be 1D. 
+            
+            accum_dtype and compensated are passed to the accumulators
+            (see ExpectationFast); the tiled storage is not compensated.
+            validation is applied to the samples in update() and to the
+            mean and covariance in the getters (see Validation), not by 
+            the accumulators.
+            
+            structure selects which part of the covariance is computed:
+            
+            - 'full': the whole covariance;
+            - 'diagonal': only the variances; the getters return 1D 
+              arrays with the diagonals of the full results;
+            - 'blocks': only the diagonal blocks with the indices in 
+              blocks (a list of disjoint lists of indices); the getters 
+              return BlockDiagonal objects. Giving blocks implies this.
+            
+            This reduces the cost from O(n^2) to O(n) or O(sum b_i^2).
+            
+            If preallocate is True, update() works in buffers allocated 
+            at the first update, so that (in fast mode) it does not 
+            allocate memory afterwards. The arrays returned by the getters
+            of the accumulators are then overwritten by the updates. 
+            This does not apply to the tiled storage.
+        '''
+        if blocks is not None:
+            structure = 'blocks'
+        if not structure in ['full', 'diagonal', 'blocks']:
+            raise ValueError('Invalid structure %r.' % structure)
+        if structure == 'blocks':
+            if blocks is None:
+                raise ValueError("structure='blocks' requires blocks.")
+            blocks = check_blocks(blocks)
+        if exact_window:
+            if max_window is None:
+                raise ValueError('exact_window requires max_window.')
+            if storage_dir is not None:
+                msg = 'exact_window and storage_dir are not compatible.'
+                raise ValueError(msg)
+        if storage_dir is not None and structure != 'full':
+            msg = "storage_dir requires structure='full'."
+            raise ValueError(msg)
+        self.exact_window = exact_window
+        # with exact_window, update_batch() calls update() for each 
+        # sample, so it can fail after applying part of the batch
+        self.atomic_update_batch = not exact_window
+        self.max_window = max_window
+        self.storage_dir = storage_dir
+        self.tile_rows = tile_rows
+        self.accum_dtype = accum_dtype
+        self.compensated = compensated
+        self.validation = Validation.from_policy(validation)
+        self.structure = structure
+        self.blocks = blocks
+        self.preallocate = preallocate
+        # with exact_window, the accumulators hold the moments about 
+        # the first sample (see _exact_covariance())
+        self.shift = None
+        # buffers for update(), if preallocate
+        self.value_norm = None
+        self.P = None
+
+        self.mean_accum = self._new_accum()
+        self.block_accums = None
+        if structure == 'blocks':
+            self.covariance_accum = None
+            self.block_accums = [self._new_accum() for _ in blocks]
+        elif storage_dir is None:
+            self.covariance_accum = self._new_accum()
+        else:
+            # created at the first update, when n is known
+            self.covariance_accum = None
         self.minimum = None
         self.maximum = None  # TODO: use class
         self.num_samples = 0
-        
+        # derived quantities: correlation, factorization, information
+        self.cache = DerivedCache()
+
+    def _new_accum(self):
+        # the samples are checked by update() and the results by the 
+        # getters, not again for each accumulator
+        validation = 'never'
+        if self.exact_window:
+            return ExpectationWindowed(window_time=self.max_window,
+                                       accum_dtype=self.accum_dtype,
+                                       validation=validation)
+        else:
+            return Expectation(self.max_window, accum_dtype=self.accum_dtype,
+                               compensated=self.compensated,
+                               validation=validation,
+                               extremely_fast=self.preallocate)
+
     def merge(self, other):
-        warnings.warn('To test')
+        ''' 
+            Merges the statistics of another MeanCovariance, using the
+            same pairwise combination as update_batch().
+        '''
         assert isinstance(other, MeanCovariance)
-        self.mean_accum.merge(other.mean_accum)
-        self.covariance_accum.merge(other.covariance_accum)
+        if other.num_samples == 0:
+            return
+        if self.exact_window or other.exact_window:
+            msg = 'Cannot merge MeanCovariance with exact_window.'
+            raise NotImplementedError(msg)
+        if not self._same_structure(other):
+            raise ValueError('Cannot merge different structures.')
+        self._update_extrema(other.maximum, other.minimum)
         self.num_samples += other.num_samples
-        warnings.warn('minimum/maximum missing')
+        other_cov = other.get_covariance()
+        if self.structure == 'full':
+            group_cov = lambda i0, i1: np.array(other_cov[i0:i1])
+        elif self.structure == 'diagonal':
+            group_cov = lambda: other_cov.copy()
+        else:
+            group_cov = lambda j: other_cov[j].copy()
+        self._combine(other.get_mean(), group_cov,
+                      float(other.mean_accum.get_mass()))
+
+    def _same_structure(self, other):
+        if self.structure != other.structure:
+            return False
+        if self.structure == 'blocks':
+            return (len(self.blocks) == len(other.blocks) and 
+                    all(np.array_equal(a, b)
+                        for a, b in zip(self.blocks, other.blocks)))
+        return True
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, max_window=self.max_window,
+                          exact_window=self.exact_window,
+                          storage_dir=self.storage_dir,
+                          tile_rows=self.tile_rows,
+                          accum_dtype=dtype_name(self.accum_dtype),
+                          compensated=self.compensated,
+                          validation=self.validation.policy,
+                          validation_interval=self.validation.interval,
+                          structure=self.structure,
+                          preallocate=self.preallocate,
+                          num_samples=self.num_samples)
+        nest_state(state, 'mean_accum', self.mean_accum)
+        nest_state(state, 'covariance_accum', self.covariance_accum)
+        if self.structure == 'blocks':
+            state['num_blocks'] = len(self.blocks)
+            for j, (idx, accum) in enumerate(zip(self.blocks,
+                                                 self.block_accums)):
+                state['blocks.%d' % j] = idx
+                nest_state(state, 'block_accums.%d' % j, accum)
+        if self.maximum is not None:
+            state['maximum'] = self.maximum
+            state['minimum'] = self.minimum
+        if getattr(self, 'last_value', None) is not None:
+            state['last_value'] = self.last_value
+        if self.shift is not None:
+            state['shift'] = self.shift
+        return state
 
+    @classmethod
+    def from_state(cls, state):
+        ''' 
+            Returns an instance with the given state; does not copy, so 
+            that the arrays can be memory-mapped. 
+        '''
+        check_state(state, cls)
+        blocks = None
+        if state['structure'] == 'blocks':
+            blocks = [state['blocks.%d' % j] 
+                      for j in range(state['num_blocks'])]
+        mc = cls(max_window=state['max_window'],
+                 exact_window=state['exact_window'],
+                 storage_dir=state['storage_dir'],
+                 tile_rows=state['tile_rows'],
+                 accum_dtype=state['accum_dtype'],
+                 compensated=state['compensated'],
+                 validation=Validation(state.get('validation', 'always'),
+                                       state.get('validation_interval', 16)),
+                 structure=state['structure'], blocks=blocks,
+                 preallocate=state.get('preallocate', False))
+        mc.mean_accum = unnest_state(state, 'mean_accum')
+        mc.covariance_accum = unnest_state(state, 'covariance_accum')
+        if blocks is not None:
+            mc.block_accums = [unnest_state(state, 'block_accums.%d' % j)
+                               for j in range(len(blocks))]
+        if 'maximum' in state:
+            mc.maximum = state['maximum']
+            mc.minimum = state['minimum']
+        if 'last_value' in state:
+            mc.last_value = state['last_value']
+        mc.shift = state.get('shift')
+        mc.num_samples = state['num_samples']
+        return mc
 
     def get_num_samples(self):
         return self.num_samples
 
     def update(self, value, dt=1.0):
+        # before changing anything: a rejected sample leaves the state as is
+        self.validation.check_update(value)
+        self._check_shape(value.shape)
         self.num_samples += dt
+        self._update_extrema(value, value)
+        self._invalidate()
+
+        self.mean_accum.update(value, dt)
+        if self.exact_window:
+            # The deviations from the current mean cannot be used: the 
+            # mean changes when the old samples are evicted.
+            if self.shift is None:
+                self.shift = np.array(value, dtype=np.result_type(value, 1.0))
+            center = self.shift
+        else:
+            center = self.mean_accum.get_value()
+        if self.preallocate and self.storage_dir is None:
+            self._update_preallocated(value, center, dt)
+        else:
+            self._update_allocating(value, center, dt)
+        self.last_value = value
+
+    def _update_allocating(self, value, center, dt):
+        value_norm = value - center
+        if self.structure == 'diagonal':
+            self.covariance_accum.update(value_norm * value_norm, dt)
+        elif self.structure == 'blocks':
+            for idx, accum in zip(self.blocks, self.block_accums):
+                v = value_norm[idx]
+                accum.update(outer(v, v), dt)
+        elif self.storage_dir is None:
+            P = outer(value_norm, value_norm)
+            self.covariance_accum.update(P, dt)
+        else:
+            self._tiled_accum(value).update_rows(
+                lambda i0, i1: outer(value_norm[i0:i1], value_norm), dt)
 
-        n = value.size
-        if  self.maximum is None:
-            self.maximum = value.copy()
-            self.minimum = value.copy()
-            self.P_t = np.zeros(shape=(n, n), dtype=value.dtype)
+    def _update_preallocated(self, value, center, dt):
+        ''' Same as update(), in the buffers allocated the first time. '''
+        if self.value_norm is None:
+            self._allocate_buffers(value, center)
+        value_norm = np.subtract(value, center, self.value_norm)
+        if self.structure == 'diagonal':
+            P = np.multiply(value_norm, value_norm, self.P)
+            self.covariance_accum.update(P, dt)
+        elif self.structure == 'blocks':
+            for idx, accum, v, P in zip(self.blocks, self.block_accums,
+                                        self.block_values, self.P):
+                # (mode='raise' would buffer the output; the indices 
+                # were checked against the first sample by _check_shape)
+                np.take(value_norm, idx, out=v, mode='clip')
+                accum.update(outer_into(v, P), dt)
         else:
-            # TODO: check dimensions
-            if not (value.shape == self.maximum.shape):
+            self.covariance_accum.update(outer_into(value_norm, self.P), dt)
+
+    def _allocate_buffers(self, value, center):
+        dtype = np.result_type(value, center)
+        self.value_norm = np.empty(value.shape, dtype)
+        if self.structure == 'diagonal':
+            self.P = np.empty(value.shape, dtype)
+        elif self.structure == 'blocks':
+            self.block_values = [np.empty(len(idx), dtype) 
+                                 for idx in self.blocks]
+            self.P = [np.empty((len(idx), len(idx)), dtype) 
+                      for idx in self.blocks]
+        else:
+            self.P = np.empty(value.shape + value.shape, dtype)
+
+    def update_batch(self, X, dts=None):
+        ''' 
+            Updates with a block of N samples, given as the rows of X.
+            
+            The block's weighted mean and scatter matrix are computed 
+            directly (the scatter is a single X^T X product) and then 
+            merged with the current state using the pairwise update of
+            Chan, Golub and LeVeque. The result is the exact weighted 
+            covariance of the data; the per-sample update() uses the 
+            updated mean for each sample and differs slightly for small 
+            numbers of samples. With exact_window, the samples are 
+            passed one by one to update().
+            
+            :param X: A (N, n) array.
+            :param dts: Weights of the N samples (default: all 1).
+        '''
+        X = np.asarray(X)
+        if X.ndim != 2:
+            raise ValueError('Expected a (N, n) array, got shape %s.' % 
+                             str(X.shape))
+        N = X.shape[0]
+        if N == 0:
+            return
+        if dts is None:
+            dts = np.ones(N)
+        else:
+            dts = np.asarray(dts, dtype='float64')
+            if dts.shape != (N,):
+                raise ValueError('Expected %d weights, got shape %s.' % 
+                                 (N, str(dts.shape)))
+        self.validation.check_update(X)
+        self._check_shape(X.shape[1:])
+
+        if self.exact_window:
+            # a block cannot be evicted sample by sample
+            for i in range(N):
+                self.update(X[i], float(dts[i]))
+            return
+
+        self._update_extrema(X.max(axis=0), X.min(axis=0))
+
+        self.last_value = X[-1]
+        wb = float(np.sum(dts))
+        if wb == 0:
+            return
+        self.num_samples += wb
+
+        mb = np.dot(dts, X) / wb
+        # Xs^T Xs is the weighted scatter around the block mean; numpy 
+        # computes the product of a matrix with its own transpose as SYRK.
+        Xs = (X - mb) * np.sqrt(dts)[:, np.newaxis]
+
+        if self.structure == 'full':
+            def group_cov(i0, i1):
+                Cb = np.dot(Xs[:, i0:i1].T, Xs)
+                Cb /= wb
+                return Cb
+        elif self.structure == 'diagonal':
+            def group_cov():
+                return np.sum(Xs * Xs, axis=0) / wb
+        else:
+            def group_cov(j):
+                Xj = Xs[:, self.blocks[j]]
+                Cb = np.dot(Xj.T, Xj)
+                Cb /= wb
+                return Cb
+
+        self._combine(mb, group_cov, wb)
+
+    def _check_shape(self, shape):
+        if self.maximum is not None:
+            if shape != self.maximum.shape:
                 raise ValueError('Value shape changed: %s -> %s' % 
-                                 (self.maximum.shape, value.shape))
-            self.maximum = np.maximum(value, self.maximum)
-            self.minimum = np.minimum(value, self.minimum)
+                                 (self.maximum.shape, shape))
+        elif self.blocks is not None:
+            # the first sample
+            n = shape[0] if len(shape) == 1 else None
+            for idx in self.blocks:
+                if n is None or (idx.size > 0 and idx.max() >= n):
+                    msg = ('The blocks %s do not fit values of shape %s.' % 
+                           ([list(b) for b in self.blocks], shape))
+                    raise ValueError(msg)
 
-        self.mean_accum.update(value, dt)
-        mean = self.mean_accum.get_value()
-        value_norm = value - mean
+    def _update_extrema(self, maximum, minimum):
+        if self.maximum is None:
+            self.maximum = maximum.copy()
+            self.minimum = minimum.copy()
+        else:
+            self._check_shape(maximum.shape)
+            if self.preallocate:
+                np.maximum(maximum, self.maximum, self.maximum)
+                np.minimum(minimum, self.minimum, self.minimum)
+            else:
+                self.maximum = np.maximum(maximum, self.maximum)
+                self.minimum = np.minimum(minimum, self.minimum)
 
-        P = outer(value_norm, value_norm)
-        self.covariance_accum.update(P, dt)
-        self.last_value = value
+    def _combine(self, mb, group_cov, wb):
+        ''' 
+            Merges a group with mean mb and mass wb into the current 
+            state. The function group_cov must return a new array with 
+            part of the group's covariance: the rows i0:i1 for 
+            group_cov(i0, i1) if the structure is 'full', the diagonal 
+            for group_cov() if 'diagonal', the j-th block for 
+            group_cov(j) if 'blocks'. 
+        '''
+        self._invalidate()
+        wa = self.mean_accum.get_mass()
+        if wa > 0:
+            delta = mb - self.mean_accum.get_value()
+            c = wa / (wa + wb)
+        else:
+            delta = np.zeros_like(mb)
+            c = 0.0
+
+        # Each part gets the between-group correction c * delta delta^T.
+        if self.structure == 'diagonal':
+            D = group_cov()
+            D += c * delta * delta
+            self.covariance_accum.update(D, wb)
+        elif self.structure == 'blocks':
+            for j, (idx, accum) in enumerate(zip(self.blocks,
+                                                 self.block_accums)):
+                C = group_cov(j)
+                C += c * outer(delta[idx], delta[idx])
+                accum.update(C, wb)
+        else:
+            def rows(i0, i1):
+                R = group_cov(i0, i1)
+                if c > 0:
+                    R += c * outer(delta[i0:i1], delta)
+                return R
+
+            if self.storage_dir is None:
+                self.covariance_accum.update(rows(0, mb.size), wb)
+            else:
+                self._tiled_accum(mb).update_rows(rows, wb)
+        self.mean_accum.update(mb, wb)
+
+    def _invalidate(self):
+        self.cache.invalidate()
+
+    def _get_eig(self):
+        ''' 
+            Returns the eigendecomposition (w, V) of the (full) 
+            covariance, computed lazily after each update. 
+        '''
+        return self.cache.get('eig', self._compute_eig)
+
+    def _compute_eig(self):
+        P = self._covariance()
+        try:
+            return np.linalg.eigh(P)
+        except LinAlgError as e:
+            msg = ('Could not decompose the covariance (%s samples): %s' % 
+                   (self.num_samples, e))
+            raise LinAlgError(msg)
+
+    def close(self):
+        ''' Deletes the file of the storage in storage_dir, if any. '''
+        if isinstance(self.covariance_accum, ExpectationTiled):
+            self.covariance_accum.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _tiled_accum(self, value):
+        if self.covariance_accum is None:
+            if value.ndim != 1:
+                msg = 'storage_dir requires 1D values; got %s.' % str(value.shape)
+                raise ValueError(msg)
+            n = value.size
+            self.covariance_accum = ExpectationTiled((n, n),
+                                                     max_window=self.max_window,
+                                                     directory=self.storage_dir,
+                                                     tile_rows=self.tile_rows,
+                                                     dtype=self.accum_dtype or 'float64')
+        return self.covariance_accum
 
     def assert_some_data(self):
         if self.num_samples == 0:
             raise Exception('Never updated')
 
+    def _covariance(self):
+        ''' Returns the (full or diagonal) covariance. '''
+        if self.exact_window:
+            C = self.cache.get('exact_covariance', 
+                               lambda: self._exact_covariance(None))
+        else:
+            C = self.covariance_accum.get_value()
+        self.validation.check_read(C)
+        return C
+
+    def _block(self, j):
+        ''' Returns the j-th block of the covariance. '''
+        if self.exact_window:
+            C = self.cache.get(('exact_covariance', j),
+                               lambda: self._exact_covariance(j))
+        else:
+            C = self.block_accums[j].get_value()
+        self.validation.check_read(C)
+        return C
+
+    def _exact_covariance(self, j):
+        ''' 
+            With exact_window, the accumulators hold the second moments 
+            E[(x - s)(x - s)^T] about the first sample s: the covariance 
+            is that minus d d^T, for d = E[x] - s. For the j-th block if
+            j is not None.
+        '''
+        d = self.mean_accum.get_value() - self.shift
+        if j is not None:
+            d = d[self.blocks[j]]
+            moment = self.block_accums[j].get_value()
+        else:
+            moment = self.covariance_accum.get_value()
+        if self.structure == 'diagonal':
+            C = moment - d * d
+            # (it could be slightly negative, due to the rounding)
+            return np.maximum(C, 0, C)
+        return moment - outer(d, d)
+
+    # The getters return read-only arrays; the derived quantities are
+    # cached until the next update.
+
     def get_mean(self):
         self.assert_some_data()
-        return self.mean_accum.get_value()
+        mean = self.mean_accum.get_value()
+        self.validation.check_read(mean)
+        return readonly(mean)
 
     def get_maximum(self):
         self.assert_some_data()
-        return self.maximum
+        return readonly(self.maximum)
 
     def get_minimum(self):
         self.assert_some_data()
-        return self.minimum
+        return readonly(self.minimum)
 
     def get_covariance(self):
         self.assert_some_data()
-        return self.covariance_accum.get_value()
+        if self.structure == 'blocks':
+            return self.cache.get('covariance', self._block_covariance)
+        return readonly(self._covariance())
+
+    def _block_covariance(self):
+        return BlockDiagonal(self.mean_accum.get_value().size, self.blocks,
+                             [readonly(self._block(j)) 
+                              for j in range(len(self.blocks))])
 
     def get_correlation(self):
         self.assert_some_data()
-        corr = cov2corr(self.covariance_accum.get_value())
-        np.fill_diagonal(corr, 1)
-        return corr
+        return self.cache.get('correlation', self._compute_correlation)
+
+    def _compute_correlation(self):
+        if self.structure == 'diagonal':
+            # by convention, the self-correlation is always 1
+            return np.ones_like(self._covariance())
+        if self.structure == 'blocks':
+            f = lambda P: readonly(correlation_with_unit_diagonal(P))
+            return self.get_covariance().map(f)
+        return correlation_with_unit_diagonal(self._covariance())
+
+    def get_correlated_pairs(self, threshold=None, top_k=None, tile_rows=None):
+        ''' 
+            Returns the pairs of variables (i, j), i < j, with 
+            |correlation| >= threshold; if top_k is given, only the top_k
+            pairs with the largest |correlation| (among those above
+            threshold, if also given).
+            
+            The covariance is read in tiles of tile_rows rows, which are
+            normalized on the fly, so the n x n correlation is never 
+            materialized (see correlated_pairs()).
+            
+            :return: A tuple (rows, cols, values) with the pairs in 
+                coordinate (COO) format; sorted by decreasing |correlation|
+                if top_k is given, by (row, col) otherwise.
+        '''
+        self.assert_some_data()
+        if tile_rows is None:
+            tile_rows = self.tile_rows
+        if self.structure == 'full':
+            return correlated_pairs(self._covariance(),
+                                    threshold=threshold, top_k=top_k,
+                                    block_rows=tile_rows)
+        if threshold is None and top_k is None:
+            raise ValueError('Give at least one of threshold and top_k.')
+        rows, cols, values = [], [], []
+        if self.structure == 'blocks':
+            for j, idx in enumerate(self.blocks):
+                r, c, v = correlated_pairs(self._block(j),
+                                           threshold=threshold, top_k=top_k,
+                                           block_rows=tile_rows)
+                rows.append(np.minimum(idx[r], idx[c]))
+                cols.append(np.maximum(idx[r], idx[c]))
+                values.append(v)
+        # (the 'diagonal' structure has no pairs)
+        return _select_pairs(rows, cols, values, top_k)
 
     def get_information(self, rcond=1e-2):
+        ''' 
+            Returns the pseudo-inverse of the covariance, as 
+            pinv(covariance, rcond). For the full structure, it is 
+            computed from an eigendecomposition that is cached until the 
+            next update. Raises LinAlgError if the decomposition fails.
+        '''
         self.assert_some_data()
-        try:
-            P = self.get_covariance()
-            return pinv(P, rcond=rcond)
-        except LinAlgError:
-            filename = 'pinv-failure'
-            import pickle
-            with  open(filename + '.pickle', 'w') as f:
-                pickle.dump(self, f)
-            # logger.error('Did not converge; saved on %s' % filename)
-
-    
-        
-        
-        
+        return self.cache.get(('information', rcond),
+                              lambda: self._compute_information(rcond))
+
+    def _compute_information(self, rcond):
+        if self.structure == 'diagonal':
+            # same as pinv() of the diagonal matrix
+            var = self._covariance()
+            info = np.zeros_like(var)
+            nonzero = var > rcond * np.max(var)
+            info[nonzero] = 1.0 / var[nonzero]
+            return info
+        if self.structure == 'blocks':
+            f = lambda P: readonly(pinv(P, rcond=rcond))
+            return self.get_covariance().map(f)
+        # Same as pinv(P, rcond), but using the cached factorization. 
+        w, V = self._get_eig()
+        large = np.abs(w) > rcond * np.max(np.abs(w))
+        Vl = V[:, large]
+        return np.dot(Vl / w[large], Vl.T)
+
+    def solve(self, b, regularization=0.0):
+        ''' 
+            Returns (covariance + regularization * I)^{-1} b, for b 
+            either a vector or a (n, m) array, using the cached 
+            factorization. Raises LinAlgError if the regularized 
+            covariance is singular. 
+        '''
+        w, V = self._get_regularized_eig(regularization)
+        b = np.asarray(b)
+        if V is None:
+            return b / (w if b.ndim == 1 else w[:, np.newaxis])
+        Vb = np.dot(V.T, b)
+        Vb /= w if b.ndim == 1 else w[:, np.newaxis]
+        return np.dot(V, Vb)
+
+    def mahalanobis(self, X, regularization=0.0):
+        ''' 
+            Returns the Mahalanobis distance from the mean of each row of
+            the (N, n) array X (or of the vector X), with respect to 
+            covariance + regularization * I. 
+        '''
+        w, V = self._get_regularized_eig(regularization)
+        D = np.asarray(X) - self.get_mean()
+        # in the eigenbasis, scaled to unit variance
+        Z = D if V is None else np.dot(D, V)
+        Z = Z / np.sqrt(w)
+        return np.sqrt(np.sum(Z * Z, axis=-1))
+
+    def log_det(self, regularization=0.0):
+        ''' Returns log det(covariance + regularization * I). '''
+        w, _ = self._get_regularized_eig(regularization)
+        return float(np.sum(np.log(w)))
+
+    def _get_regularized_eig(self, regularization):
+        ''' 
+            Returns (w, V) with the eigenvalues of the regularized 
+            covariance and the eigenvectors; V is None for the 
+            'diagonal' structure. 
+        '''
+        self.assert_some_data()
+        if self.structure == 'full':
+            w, V = self._get_eig()
+        elif self.structure == 'diagonal':
+            w, V = self._covariance(), None
+        else:
+            msg = "Not available for structure %r." % self.structure
+            raise ValueError(msg)
+        w = w + regularization
+        # the usual tolerance for the numerical rank
+        tol = w.size * np.finfo(float).eps * np.max(np.abs(w))
+        if not np.all(w > tol):
+            msg = ('The covariance is singular (min eigenvalue %g); '
+                   'use regularization > 0.' % np.min(w))
+            raise LinAlgError(msg)
+        return w, V
+
+
+def correlation_with_unit_diagonal(covariance):
+    corr = cov2corr(covariance)
+    np.fill_diagonal(corr, 1)
+    return corr
+
+
+def correlated_pairs(covariance, threshold=None, top_k=None, block_rows=None):
+    ''' 
+        Returns the pairs (i, j), i < j, of entries of the correlation
+        of covariance with |correlation| >= threshold and/or the top_k 
+        ones with the largest |correlation|, as a tuple 
+        (rows, cols, values). 
         
+        The covariance, which can be a memory-mapped array, is read 
+        block_rows rows at a time, so that the extra memory is 
+        O(block_rows * n + top_k) plus the size of the result.
+    '''
+    if threshold is None and top_k is None:
+        raise ValueError('Give at least one of threshold and top_k.')
+    if top_k is not None and top_k < 1:
+        raise ValueError('Invalid top_k %r.' % top_k)
+    n = covariance.shape[0]
+    if block_rows is None:
+        row_bytes = max(1, n * np.dtype('float64').itemsize)
+        block_rows = max(1, ExpectationTiled.TILE_BYTES // row_bytes)
+    # same conventions as cov2corr()
+    sigma = np.sqrt(np.diagonal(covariance))
+    sigma[sigma == 0] = 1
+    one_over = 1.0 / sigma
+
+    columns = np.arange(n)
+    rows, cols, values = [], [], []
+    for i0 in range(0, n, block_rows):
+        i1 = min(n, i0 + block_rows)
+        R = np.multiply(covariance[i0:i1], one_over[i0:i1, np.newaxis])
+        R *= one_over
+        A = np.abs(R)
+        # only the strict upper triangle
+        A[columns <= np.arange(i0, i1)[:, np.newaxis]] = -1
+        if threshold is not None:
+            A[A < threshold] = -1
+        if top_k is not None and top_k < A.size:
+            flat = np.argpartition(A, A.size - top_k, axis=None)[-top_k:]
+            flat = flat[A.flat[flat] >= 0]
+            flat.sort()
+        else:
+            flat = np.flatnonzero(A >= 0)
+        r, c = np.unravel_index(flat, A.shape)
+        rows.append(r + i0)
+        cols.append(c)
+        values.append(R[r, c])
+        if top_k is not None:
+            # keep only the running top_k
+            rows, cols, values = [[x] for x in 
+                                  _select_pairs(rows, cols, values, top_k)]
+    return _select_pairs(rows, cols, values, top_k)
+
+
+def _select_pairs(rows, cols, values, top_k):
+    ''' 
+        Concatenates lists of pairs, sorted by (row, col); if top_k is 
+        not None, keeps the top_k ones, sorted by decreasing |value|. 
+    '''
+    concat = lambda x, dtype: (np.concatenate(x) if x else 
+                               np.zeros(0, dtype=dtype))
+    rows = concat(rows, 'intp')
+    cols = concat(cols, 'intp')
+    values = concat(values, 'float64')
+    if top_k is not None:
+        # stable, so that ties are in (row, col) order
+        order = np.argsort(-np.abs(values), kind='stable')[:top_k]
+    else:
+        order = np.lexsort((cols, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    return rows, cols, values
@@ -0,0 +1,240 @@
+''' 
+    Bounded-memory approximation of the covariance, for high-dimensional 
+    streams of which we only need the principal subspace.
+    
+    Liberty, Edo (2013). Simple and Deterministic Matrix Sketching. KDD.
+    
+    Ghashami, M.; Liberty, E.; Phillips, J. M.; Woodruff, D. P. (2016).
+    Frequent Directions: Simple and Deterministic Matrix Sketching.
+    SIAM Journal on Computing 45(5), 1762-1792.
+'''
+import numpy as np
+from astatsa.utils import contracts_bypassable
+
+__all__ = ['MeanCovarianceSketch', 'LowRankPlusDiagonal']
+
+
+@contracts_bypassable
+class MeanCovarianceSketch(object):
+    ''' 
+        Computes the mean and an approximation of the covariance of a 
+        1D quantity, using O(ell * n) memory. 
+        
+        The scatter matrix M2 (the covariance times the mass) is the sum 
+        of the outer products of the rows 
+        
+            sqrt(w * dt / (w + dt)) * (x - mean)
+            
+        (Welford's update; w is the mass before x). These rows are fed 
+        to a Frequent Directions sketch B with at most 2 * ell rows: 
+        when the buffer is full, it is replaced by its SVD, with the 
+        squared singular values reduced by the ell-th largest one. 
+        This costs O(n ell^2) every ell rows, that is O(n ell) amortized,
+        and guarantees that, for the covariance C = M2 / mass,
+        
+            0 <= C - B^T B / mass <= sum_{i > k} lambda_i(C) / (ell - k)
+        
+        in the spectral norm, where lambda_i(C) are the eigenvalues of C. 
+        
+        The diagonal (the variances) is kept exactly; get_covariance()
+        returns the sketch plus a diagonal correction.
+    '''
+
+    def __init__(self, k, ell=None):
+        ''' 
+            :param k: Number of principal components of interest.
+            :param ell: Size of the sketch (default: 2 * k); must be > k.
+        '''
+        if ell is None:
+            ell = 2 * k
+        if not (k >= 1 and ell > k):
+            msg = 'Invalid sketch size k=%r ell=%r.' % (k, ell)
+            raise ValueError(msg)
+        self.k = k
+        self.ell = ell
+        self.mass = 0.0
+        self.num_samples = 0
+        self.mean = None
+        self.diag_m2 = None
+        self.sketch = None
+        self.nrows = 0  # rows of sketch that are used
+
+    def get_num_samples(self):
+        return self.num_samples
+
+    def update(self, value, dt=1.0):
+        value = np.asarray(value)
+        self._check_value(value)
+        self.num_samples += dt
+
+        if self.mass == 0:
+            self.mean[...] = value
+            self.mass = dt
+            return
+
+        d = value - self.mean
+        w = self.mass + dt
+        c = self.mass * dt / w
+        self.mean += (dt / w) * d
+        self.diag_m2 += c * d * d
+        self.mass = w
+        self._append_rows((np.sqrt(c) * d)[np.newaxis, :])
+
+    def update_batch(self, X, dts=None):
+        ''' 
+            Updates with a block of N samples, given as the rows of X,
+            combining it with the current state as in 
+            MeanCovariance.update_batch(). 
+        '''
+        X = np.asarray(X)
+        if X.ndim != 2:
+            raise ValueError('Expected a (N, n) array, got shape %s.' % 
+                             str(X.shape))
+        N = X.shape[0]
+        if N == 0:
+            return
+        if dts is None:
+            dts = np.ones(N)
+        else:
+            dts = np.asarray(dts, dtype='float64')
+            if dts.shape != (N,):
+                raise ValueError('Expected %d weights, got shape %s.' % 
+                                 (N, str(dts.shape)))
+        self._check_value(X[0])
+
+        wb = float(np.sum(dts))
+        if wb == 0:
+            return
+        self.num_samples += wb
+        mb = np.dot(dts, X) / wb
+        Xc = X - mb
+        diag_b = np.dot(dts, Xc * Xc)
+        rows = Xc * np.sqrt(dts)[:, np.newaxis]
+        self._combine(mb, diag_b, rows, wb)
+
+    def merge(self, other):
+        ''' Merges the statistics of another MeanCovarianceSketch. '''
+        assert isinstance(other, MeanCovarianceSketch)
+        if other.mass == 0:
+            return
+        self._check_value(other.mean)
+        self.num_samples += other.num_samples
+        self._combine(other.mean, other.diag_m2,
+                      other.sketch[:other.nrows], other.mass)
+
+    def _combine(self, mb, diag_b, rows, wb):
+        ''' Merges a group with mean mb, scatter rows^T rows, mass wb. '''
+        if self.mass == 0:
+            self.mean[...] = mb
+            self.diag_m2[...] = diag_b
+        else:
+            delta = mb - self.mean
+            w = self.mass + wb
+            c = self.mass * wb / w
+            self.mean += (wb / w) * delta
+            self.diag_m2 += diag_b
+            self.diag_m2 += c * delta * delta
+            # between-group correction
+            rows = np.vstack((rows, np.sqrt(c) * delta))
+        self.mass += wb
+        self._append_rows(rows)
+
+    def _check_value(self, value):
+        if value.ndim != 1:
+            msg = 'Expected a 1D value, got shape %s.' % str(value.shape)
+            raise ValueError(msg)
+        if self.mean is None:
+            n = value.size
+            self.mean = np.zeros(n)
+            self.diag_m2 = np.zeros(n)
+            self.sketch = np.zeros((2 * self.ell, n))
+        elif value.shape != self.mean.shape:
+            raise ValueError('Value shape changed: %s -> %s' % 
+                             (self.mean.shape, value.shape))
+
+    def _append_rows(self, rows):
+        capacity = self.sketch.shape[0]
+        i = 0
+        while i < rows.shape[0]:
+            if self.nrows == capacity:
+                self._shrink()
+            m = min(rows.shape[0] - i, capacity - self.nrows)
+            self.sketch[self.nrows:self.nrows + m] = rows[i:i + m]
+            self.nrows += m
+            i += m
+
+    def _shrink(self):
+        _, s, Vt = np.linalg.svd(self.sketch[:self.nrows], full_matrices=False)
+        s2 = s * s
+        if s2.size >= self.ell:
+            s2 -= s2[self.ell - 1]
+        keep = int(np.sum(s2 > 0))
+        self.sketch.fill(0)
+        self.sketch[:keep] = np.sqrt(s2[:keep])[:, np.newaxis] * Vt[:keep]
+        self.nrows = keep
+
+    def assert_some_data(self):
+        if self.num_samples == 0:
+            raise Exception('Never updated')
+
+    def get_mean(self):
+        self.assert_some_data()
+        return self.mean
+
+    def get_variance(self):
+        ''' Returns the (exact) variances, the diagonal of the covariance. '''
+        self.assert_some_data()
+        return self.diag_m2 / self.mass
+
+    def get_covariance(self):
+        ''' 
+            Returns the approximate covariance as a LowRankPlusDiagonal 
+            operator; its diagonal is exact. 
+        '''
+        self.assert_some_data()
+        B = self.sketch[:self.nrows] / np.sqrt(self.mass)
+        diagonal = self.get_variance() - np.sum(B * B, axis=0)
+        np.maximum(diagonal, 0, diagonal)
+        return LowRankPlusDiagonal(B, diagonal)
+
+    def get_principal_components(self):
+        ''' 
+            Returns a tuple (variances, components) with the top k 
+            principal directions, as the rows of the (k, n) array 
+            components, and the variance along each of them. 
+        '''
+        self.assert_some_data()
+        B = self.sketch[:self.nrows]
+        _, s, Vt = np.linalg.svd(B, full_matrices=False)
+        k = min(self.k, s.size)
+        return (s[:k] ** 2) / self.mass, Vt[:k]
+
+
+class LowRankPlusDiagonal(object):
+    ''' The symmetric n x n operator factor^T * factor + diag(diagonal). '''
+
+    def __init__(self, factor, diagonal):
+        self.factor = factor
+        self.diagonal = diagonal
+        n = diagonal.size
+        self.shape = (n, n)
+
+    def dot(self, x):
+        ''' Multiplies by a vector or by a (n, m) matrix. '''
+        x = np.asarray(x)
+        Fx = np.dot(self.factor.T, np.dot(self.factor, x))
+        if x.ndim == 1:
+            return Fx + self.diagonal * x
+        return Fx + self.diagonal[:, np.newaxis] * x
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def get_diagonal(self):
+        return np.sum(self.factor * self.factor, axis=0) + self.diagonal
+
+    def todense(self):
+        ''' Returns the n x n array; O(n^2) memory. '''
+        M = np.dot(self.factor.T, self.factor)
+        M[np.diag_indices_from(M)] += self.diagonal
+        return M
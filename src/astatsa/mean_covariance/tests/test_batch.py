@@ -0,0 +1,48 @@
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def check_batch(n, N, nblocks):
+    X = np.random.randn(N, n) + 10
+    dts = np.random.rand(N) + 0.1
+
+    mc = MeanCovariance()
+    for block in np.array_split(np.arange(N), nblocks):
+        mc.update_batch(X[block], dts[block])
+
+    mean = np.average(X, axis=0, weights=dts)
+    cov = np.cov(X.T, aweights=dts, bias=True)
+    assert_allclose(mc.get_mean(), mean)
+    assert_allclose(mc.get_covariance(), cov, atol=1e-10)
+    assert_allclose(mc.get_maximum(), X.max(axis=0))
+    assert_allclose(mc.get_minimum(), X.min(axis=0))
+    assert_allclose(mc.get_num_samples(), dts.sum())
+
+
+def test_batch():
+    for n in [1, 5, 50]:
+        for N, nblocks in [(1, 1), (10, 1), (100, 7), (1000, 100)]:
+            check_batch(n, N, nblocks)
+
+
+def test_batch_after_update():
+    X = np.random.randn(200, 4)
+    mc = MeanCovariance()
+    for x in X[:100]:
+        mc.update(x)
+    mc.update_batch(X[100:])
+    assert_allclose(mc.get_mean(), X.mean(axis=0))
+    # the sequential part is only asymptotically exact
+    assert_allclose(mc.get_covariance(), np.cov(X.T, bias=True), atol=0.05)
+
+
+def test_batch_shape_changed():
+    mc = MeanCovariance()
+    mc.update_batch(np.zeros((3, 4)))
+    try:
+        mc.update_batch(np.zeros((3, 5)))
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
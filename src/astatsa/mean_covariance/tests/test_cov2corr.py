@@ -0,0 +1,51 @@
+from astatsa.mean_covariance import cov2corr
+from astatsa.utils import assert_allclose
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+def reference(C):
+    sigma = np.sqrt(np.diag(C))
+    sigma[sigma == 0] = 1
+    return C / np.multiply.outer(sigma, sigma)
+
+
+def random_covariance(n):
+    A = np.random.randn(n, n + 3)
+    C = np.dot(A, A.T)
+    C[2, :] = C[:, 2] = 0  # a constant variable
+    return C
+
+
+def test_cov2corr():
+    C = random_covariance(9)
+    R = reference(C)
+    assert_allclose(cov2corr(C), R)
+    for block_rows in [1, 2, 4, 9, 20]:
+        assert_allclose(cov2corr(C, block_rows=block_rows), R)
+
+    Z = cov2corr(C, zero_diagonal=True, block_rows=4)
+    assert_allclose(np.diag(Z), 0)
+
+    out = np.empty_like(C)
+    assert cov2corr(C, out=out, block_rows=3) is out
+    assert_allclose(out, R)
+
+    C2 = C.copy()
+    assert cov2corr(C2, inplace=True, block_rows=2) is C2
+    assert_allclose(C2, R)
+
+
+def test_cov2corr_memmap():
+    dirname = tempfile.mkdtemp()
+    try:
+        C = random_covariance(20)
+        out = np.memmap(os.path.join(dirname, 'corr.dat'), dtype='float64',
+                        mode='w+', shape=C.shape)
+        cov2corr(C, out=out, block_rows=3)
+        assert_allclose(out, reference(C))
+        del out
+    finally:
+        shutil.rmtree(dirname)
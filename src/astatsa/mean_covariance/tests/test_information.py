@@ -0,0 +1,22 @@
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def test_information_cached():
+    X = np.random.randn(50, 6)
+    X[:, 5] = X[:, 4]  # singular covariance
+    mc = MeanCovariance()
+    mc.update_batch(X[:40])
+    for rcond in [1e-2, 1e-10]:
+        info = mc.get_information(rcond=rcond)
+        assert_allclose(info, np.linalg.pinv(mc.get_covariance(), rcond=rcond),
+                        atol=1e-8)
+        assert mc.get_information(rcond=rcond) is info
+        assert not info.flags.writeable
+
+    mc.update(X[40])
+    info2 = mc.get_information()
+    assert info2 is not info
+    assert_allclose(info2, np.linalg.pinv(mc.get_covariance(), rcond=1e-2),
+                    atol=1e-8)
@@ -0,0 +1,97 @@
+from astatsa.mean_covariance import MeanCovariance, correlated_pairs
+from astatsa.utils import assert_allclose
+import numpy as np
+import shutil
+import tempfile
+
+
+def dense_pairs(R, threshold):
+    n = R.shape[0]
+    I, J = np.nonzero(np.triu(np.abs(R) >= threshold, 1))
+    return I, J, R[I, J]
+
+
+def correlated_data(N, n):
+    X = np.random.randn(N, n)
+    X[:, 3] = X[:, 1] + 0.1 * X[:, 3]
+    X[:, 7] = -X[:, 2] + 0.2 * X[:, 7]
+    X[:, 5] = 1  # zero variance
+    return X
+
+
+def test_correlated_pairs_threshold():
+    mc = MeanCovariance()
+    mc.update_batch(correlated_data(200, 10))
+    R = mc.get_correlation()
+    for threshold in [0.9, 0.1, 0.0]:
+        I, J, V = dense_pairs(R, threshold)
+        for tile_rows in [None, 1, 3]:
+            r, c, v = mc.get_correlated_pairs(threshold=threshold,
+                                              tile_rows=tile_rows)
+            assert np.all(r == I) and np.all(c == J)
+            assert_allclose(v, V)
+    r, c, _ = mc.get_correlated_pairs(threshold=0.9)
+    assert set(zip(r, c)) == set([(1, 3), (2, 7)])
+
+
+def test_correlated_pairs_top_k():
+    mc = MeanCovariance()
+    mc.update_batch(correlated_data(200, 10))
+    R = mc.get_correlation()
+    I, J, V = dense_pairs(R, 0)
+    order = np.argsort(-np.abs(V), kind='stable')
+    for top_k in [1, 2, 5, 100]:
+        for tile_rows in [1, 4, 10]:
+            r, c, v = mc.get_correlated_pairs(top_k=top_k, tile_rows=tile_rows)
+            k = min(top_k, len(V))
+            assert len(v) == k
+            assert_allclose(v, V[order[:k]])
+    r, c, v = mc.get_correlated_pairs(threshold=0.999, top_k=3)
+    assert len(v) == 0
+
+
+def test_correlated_pairs_storage():
+    dirname = tempfile.mkdtemp()
+    try:
+        X = correlated_data(100, 12)
+        mc = MeanCovariance(storage_dir=dirname, tile_rows=5)
+        mc.update_batch(X)
+        r, c, v = mc.get_correlated_pairs(threshold=0.5)
+        I, J, V = dense_pairs(correlation_of(X), 0.5)
+        assert np.all(r == I) and np.all(c == J)
+        assert_allclose(v, V)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def correlation_of(X):
+    mc = MeanCovariance()
+    mc.update_batch(X)
+    return mc.get_correlation()
+
+
+def test_correlated_pairs_structures():
+    X = correlated_data(100, 10)
+    mc = MeanCovariance(blocks=[[3, 0, 1], [2, 7, 5]])
+    mc.update_batch(X)
+    r, c, v = mc.get_correlated_pairs(threshold=0.9)
+    assert list(zip(r, c)) == [(1, 3), (2, 7)]
+    r, c, v = mc.get_correlated_pairs(top_k=1)
+    assert len(v) == 1
+
+    mc = MeanCovariance(structure='diagonal')
+    mc.update_batch(X)
+    r, c, v = mc.get_correlated_pairs(threshold=0.5)
+    assert len(r) == len(c) == len(v) == 0
+
+
+def test_correlated_pairs_function():
+    C = np.cov(correlated_data(50, 8).T)
+    r, c, v = correlated_pairs(C, top_k=2, block_rows=2)
+    assert len(v) == 2
+    try:
+        correlated_pairs(C)
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
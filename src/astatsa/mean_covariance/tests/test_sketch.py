@@ -0,0 +1,61 @@
+from astatsa.mean_covariance import MeanCovarianceSketch
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def low_rank_data(N, n, rank, noise):
+    basis = np.random.randn(rank, n)
+    scales = np.arange(rank, 0, -1)[:, np.newaxis] * 3.0
+    X = np.dot(np.random.randn(N, rank), scales * basis)
+    return X + noise * np.random.randn(N, n) + 5
+
+
+def check_bound(sketch, X):
+    C = np.cov(X.T, bias=True)
+    k, ell = sketch.k, sketch.ell
+    lambdas = np.sort(np.linalg.eigvalsh(C))[::-1]
+    bound = np.sum(lambdas[k:]) / (ell - k)
+
+    approx = sketch.get_covariance()
+    B = approx.factor
+    error = np.linalg.norm(C - np.dot(B.T, B), 2)
+    assert error <= bound * (1 + 1e-8) + 1e-8, (error, bound)
+    assert_allclose(sketch.get_mean(), X.mean(axis=0))
+    assert_allclose(approx.get_diagonal(), np.diag(C))
+    assert_allclose(approx.todense(), approx.dot(np.eye(X.shape[1])))
+
+
+def test_sketch_bound():
+    X = low_rank_data(500, 40, 3, 0.1)
+    s1 = MeanCovarianceSketch(k=3, ell=8)
+    for x in X:
+        s1.update(x)
+    check_bound(s1, X)
+
+    s2 = MeanCovarianceSketch(k=3, ell=8)
+    for block in np.array_split(X, 9):
+        s2.update_batch(block)
+    check_bound(s2, X)
+
+    s3 = MeanCovarianceSketch(k=3, ell=8)
+    s3.update_batch(X[:200])
+    s4 = MeanCovarianceSketch(k=3, ell=8)
+    s4.update_batch(X[200:])
+    s3.merge(s4)
+    check_bound(s3, X)
+
+
+def test_sketch_principal_components():
+    X = low_rank_data(1000, 30, 2, 0.01)
+    sketch = MeanCovarianceSketch(k=2)
+    sketch.update_batch(X)
+    variances, components = sketch.get_principal_components()
+    assert components.shape == (2, 30)
+
+    C = np.cov(X.T, bias=True)
+    w, V = np.linalg.eigh(C)
+    top = V[:, ::-1][:, :2]
+    # the two subspaces coincide
+    P = np.dot(components, top)
+    assert_allclose(np.abs(np.linalg.det(P)), 1, rtol=1e-3)
+    assert_allclose(variances, w[::-1][:2], rtol=1e-3)
@@ -0,0 +1,41 @@
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.utils import assert_allclose
+from numpy.linalg import LinAlgError
+import numpy as np
+
+
+def test_solve_mahalanobis_log_det():
+    X = np.random.randn(200, 5)
+    for structure in ['full', 'diagonal']:
+        mc = MeanCovariance(structure=structure)
+        mc.update_batch(X)
+        P = mc.get_covariance()
+        if structure == 'diagonal':
+            P = np.diag(P)
+        for reg in [0.0, 0.5]:
+            Pr = P + reg * np.eye(5)
+            b = np.random.randn(5)
+            B = np.random.randn(5, 3)
+            assert_allclose(mc.solve(b, reg), np.linalg.solve(Pr, b))
+            assert_allclose(mc.solve(B, reg), np.linalg.solve(Pr, B))
+            assert_allclose(mc.log_det(reg), np.linalg.slogdet(Pr)[1])
+
+            Q = np.random.randn(10, 5)
+            D = Q - mc.get_mean()
+            expected = np.sqrt(np.sum(D * np.linalg.solve(Pr, D.T).T, axis=1))
+            assert_allclose(mc.mahalanobis(Q, reg), expected)
+            assert_allclose(mc.mahalanobis(Q[0], reg), expected[0])
+
+
+def test_solve_singular():
+    X = np.random.randn(50, 3)
+    X[:, 2] = 0
+    mc = MeanCovariance()
+    mc.update_batch(X)
+    try:
+        mc.solve(np.ones(3))
+    except LinAlgError:
+        pass
+    else:
+        raise Exception('Expected LinAlgError')
+    mc.solve(np.ones(3), regularization=1e-3)
@@ -0,0 +1,53 @@
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.utils import assert_allclose
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+def test_storage_dir():
+    dirname = tempfile.mkdtemp()
+    try:
+        X = np.random.randn(200, 13)
+        mc1 = MeanCovariance()
+        mc2 = MeanCovariance(storage_dir=dirname, tile_rows=4)
+        for x in X[:50]:
+            mc1.update(x)
+            mc2.update(x)
+        mc1.update_batch(X[50:])
+        mc2.update_batch(X[50:])
+
+        assert isinstance(mc2.get_covariance(), np.memmap)
+        assert len(os.listdir(dirname)) == 1
+        assert_allclose(mc1.get_mean(), mc2.get_mean())
+        assert_allclose(mc1.get_covariance(), mc2.get_covariance())
+
+        mc3 = MeanCovariance(storage_dir=dirname, tile_rows=5)
+        mc3.update_batch(X[:100])
+        mc4 = MeanCovariance()
+        mc4.update_batch(X[100:])
+        mc3.merge(mc4)
+        assert_allclose(mc3.get_covariance(), np.cov(X.T, bias=True))
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_storage_close():
+    dirname = tempfile.mkdtemp()
+    try:
+        X = np.random.randn(20, 5)
+        with MeanCovariance(storage_dir=dirname) as mc:
+            mc.update_batch(X)
+            assert len(os.listdir(dirname)) == 1
+        assert os.listdir(dirname) == []
+        # nothing to delete
+        MeanCovariance().close()
+        mc = MeanCovariance(storage_dir=dirname)
+        mc.close()
+        mc.update_batch(X)
+        mc.covariance_accum.close()
+        mc.close()
+        assert os.listdir(dirname) == []
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,91 @@
+from astatsa.mean_covariance import MeanCovariance, BlockDiagonal
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def updated(X, **kwargs):
+    mc = MeanCovariance(**kwargs)
+    for x in X[:20]:
+        mc.update(x)
+    mc.update_batch(X[20:])
+    return mc
+
+
+def test_diagonal():
+    X = np.random.randn(100, 6)
+    full = updated(X)
+    diag = updated(X, structure='diagonal')
+    assert_allclose(diag.get_mean(), full.get_mean())
+    assert_allclose(diag.get_covariance(), np.diag(full.get_covariance()))
+    assert_allclose(diag.get_correlation(), np.ones(6))
+    assert_allclose(diag.get_information(),
+                    1 / np.diag(full.get_covariance()))
+
+
+def test_blocks():
+    X = np.random.randn(100, 7)
+    blocks = [[0, 3], [1, 2, 6]]
+    full = updated(X)
+    mc = updated(X, blocks=blocks)
+    C = full.get_covariance()
+
+    cov = mc.get_covariance()
+    assert isinstance(cov, BlockDiagonal)
+    for b, M in zip(blocks, cov.matrices):
+        assert_allclose(M, C[np.ix_(b, b)])
+    dense = cov.todense()
+    assert_allclose(dense[4], np.zeros(7))
+    v = np.random.randn(7)
+    assert_allclose(cov.dot(v), np.dot(dense, v))
+
+    corr = mc.get_correlation()
+    R = full.get_correlation()
+    for b, M in zip(blocks, corr.matrices):
+        assert_allclose(M, R[np.ix_(b, b)])
+
+    info = mc.get_information()
+    for b, M in zip(blocks, info.matrices):
+        assert_allclose(M, np.linalg.pinv(C[np.ix_(b, b)], rcond=1e-2))
+
+
+def test_blocks_merge():
+    X = np.random.randn(100, 5)
+    blocks = [[0, 1], [4]]
+    mc1 = MeanCovariance(blocks=blocks)
+    mc1.update_batch(X[:40])
+    mc2 = MeanCovariance(blocks=blocks)
+    mc2.update_batch(X[40:])
+    mc1.merge(mc2)
+    C = np.cov(X.T, bias=True)
+    for b, M in zip(blocks, mc1.get_covariance().matrices):
+        assert_allclose(M, C[np.ix_(b, b)])
+
+    diag = MeanCovariance(structure='diagonal')
+    diag.update_batch(X)
+    try:
+        mc1.merge(diag)
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
+
+
+def test_blocks_invalid():
+    def raises_value_error(f):
+        try:
+            f()
+        except ValueError:
+            return True
+        return False
+
+    for blocks in [[[0, 1], [1, 2]], [[0, 0]], [[0, -1]], [[0.5, 1]],
+                   [[[0, 1]]]]:
+        assert raises_value_error(lambda: MeanCovariance(blocks=blocks))
+
+    # the indices must be smaller than the dimension of the first sample
+    for preallocate in [False, True]:
+        mc = MeanCovariance(blocks=[[0, 5], [1, 2]], preallocate=preallocate)
+        assert raises_value_error(lambda: mc.update(np.ones(3)))
+        assert raises_value_error(lambda: mc.update_batch(np.ones((4, 3))))
+        assert mc.get_num_samples() == 0
+        mc.update(np.ones(6))
@@ -1,33 +1,139 @@
 import numpy as np
 from contracts import contract
-from ..expectation import Expectation
-from reprep import Report
+from ..expectation import Expectation, ExpectationWindowed
+from ..utils import (contracts_bypassable, DerivedCache, readonly, 
+    Validation)
+from ..utils.state import new_state, check_state, nest_state, unnest_state
 
 __all__ = ['MeanVariance']
 
 
 # TODO: write tests for this
 
+@contracts_bypassable
 class MeanVariance(object):
 
     ''' Computes mean and variance of some stream. '''
-    def __init__(self, max_window=None):
-        self.Ex = Expectation(max_window)
-        self.Edx2 = Expectation(max_window)
+    def __init__(self, max_window=None, exact_window=False,
+                 accum_dtype=None, compensated=False, validation='always',
+                 preallocate=False):
+        ''' 
+            By default, max_window only clamps the mass of the 
+            accumulators, which gives an exponential forgetting. 
+            If exact_window is True, the statistics are computed over
+            the most recent samples with total mass at most max_window.
+            
+            accum_dtype and compensated are passed to the accumulators 
+            (see ExpectationFast). validation is applied to the samples
+            in update() and to the results in the getters (see 
+            Validation), not by the accumulators.
+            
+            If preallocate is True, update() works in preallocated 
+            buffers and does not allocate memory after the first call
+            (in fast mode); the arrays returned by get_mean() and 
+            get_var() are then overwritten by the following updates.
+        '''
+        # update() checks the samples and the getters the results, not 
+        # again for each accumulator
+        self.validation = Validation.from_policy(validation)
+        if exact_window:
+            if max_window is None:
+                raise ValueError('exact_window requires max_window.')
+            self.Ex = ExpectationWindowed(window_time=max_window,
+                                          accum_dtype=accum_dtype,
+                                          validation='never')
+            self.Edx2 = ExpectationWindowed(window_time=max_window,
+                                            accum_dtype=accum_dtype,
+                                            validation='never')
+        else:
+            self.Ex = Expectation(max_window, accum_dtype=accum_dtype,
+                                  compensated=compensated,
+                                  validation='never',
+                                  extremely_fast=preallocate)
+            self.Edx2 = Expectation(max_window, accum_dtype=accum_dtype,
+                                    compensated=compensated,
+                                    validation='never',
+                                    extremely_fast=preallocate)
+        self.exact_window = exact_window
+        self.preallocate = preallocate
+        # with exact_window, Edx2 holds E[(x - shift)^2] (see get_var())
+        self.shift = None
+        self.dx = None
         self.num_samples = 0
+        self.cache = DerivedCache()
 
     def merge(self, other):
+        ''' 
+            Merges the statistics of another MeanVariance. The variance 
+            of the union is the weighted average of the two variances 
+            plus a correction for the difference of the means 
+            (Chan, Golub, LeVeque). 
+        '''
+        assert isinstance(other, MeanVariance)
+        if other.num_samples == 0:
+            return
+        wa = self.Ex.get_mass()
+        wb = other.Ex.get_mass()
+        var_b = other.get_var()
+        if wa > 0:
+            delta = other.get_mean() - self.get_mean()
+            var_b = var_b + (wa / (wa + wb)) * delta * delta
         self.Ex.merge(other.Ex)
-        self.Edx2.merge(other.Edx2)
+        self.Edx2.update(var_b, float(wb))
         self.num_samples += other.num_samples
+        self.cache.invalidate()
+
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, num_samples=self.num_samples,
+                          exact_window=self.exact_window,
+                          validation=self.validation.policy,
+                          validation_interval=self.validation.interval,
+                          preallocate=self.preallocate)
+        nest_state(state, 'Ex', self.Ex)
+        nest_state(state, 'Edx2', self.Edx2)
+        if self.shift is not None:
+            state['shift'] = self.shift
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        mv = cls(validation=Validation(state.get('validation', 'always'),
+                                       state.get('validation_interval', 16)),
+                 preallocate=state.get('preallocate', False))
+        mv.exact_window = bool(state.get('exact_window', False))
+        mv.Ex = unnest_state(state, 'Ex')
+        mv.Edx2 = unnest_state(state, 'Edx2')
+        mv.shift = state.get('shift')
+        mv.num_samples = state['num_samples']
+        return mv
 
     @contract(x='array', dt='float,>0')
     def update(self, x, dt=1.0):
-        self.num_samples += dt
+        self.validation.check_update(x)
         self.Ex.update(x, dt)
-        dx = x - self.Ex()
-        dx2 = dx * dx
+        self.num_samples += dt
+        if self.exact_window:
+            # The deviations from the current mean cannot be used: the 
+            # mean changes when the old samples are evicted.
+            if self.shift is None:
+                self.shift = np.array(x, dtype=np.result_type(x, 1.0))
+            center = self.shift
+        else:
+            center = self.Ex()
+        if self.preallocate:
+            if self.dx is None:
+                self.dx = np.empty_like(self.Ex())
+            dx2 = self.dx
+            np.subtract(x, center, dx2)
+            np.multiply(dx2, dx2, dx2)
+        else:
+            dx = x - center
+            dx2 = dx * dx
         self.Edx2.update(dx2, dt)
+        self.cache.invalidate()
 
 
     def assert_some_data(self):
@@ -35,13 +141,27 @@ class MeanVariance(object):
             raise Exception('Never updated')
 
     def get_mean(self):
-        return self.Ex()
+        mean = self.Ex()
+        self.validation.check_read(mean)
+        return readonly(mean)
 
     def get_var(self):
-        return self.Edx2()
+        if self.exact_window:
+            var = self.cache.get('var', self._exact_var)
+        else:
+            var = self.Edx2()
+        self.validation.check_read(var)
+        return readonly(var)
+
+    def _exact_var(self):
+        ''' Returns E[(x - s)^2] - (E[x] - s)^2, for s = shift. '''
+        d = self.Ex() - self.shift
+        var = self.Edx2() - d * d
+        # (it could be slightly negative, due to the rounding)
+        return np.maximum(var, 0, var)
 
     def get_std_dev(self):
-        return np.sqrt(self.get_var())
+        return self.cache.get('std_dev', lambda: np.sqrt(self.get_var()))
     
     def get_mean_stddev(self):
         """ returns a tuple (mean, stddev) """
@@ -50,7 +170,8 @@ class MeanVariance(object):
     def publish(self, pub):
         self.display(pub)
     
-    @contract(report=Report)
+    # Not importing reprep.Report here, as it pulls in the plotting stack.
+    @contract(report='isinstance(Report)')
     def display(self, report):
         if self.num_samples == 0:
             report.text('warning',
@@ -0,0 +1,74 @@
+''' 
+    Computing statistics of a dataset split in chunks, in parallel. 
+    
+    Each chunk is reduced by a fresh accumulator in a worker process;
+    the partial accumulators are then merged pairwise, in a tree. 
+'''
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+__all__ = ['reduce', 'reduce_chunk', 'feed_chunk', 'tree_merge']
+
+
+def reduce(accumulator_factory, chunks, workers=None):
+    ''' 
+        Reduces the chunks using a process pool and returns the merged
+        accumulator.
+        
+        :param accumulator_factory: A picklable callable returning a new
+            accumulator (for example, the class MeanCovariance).
+        :param chunks: An iterable of chunks; see reduce_chunk().
+        :param workers: Number of processes; if 1, everything happens 
+            in the current process. 
+    '''
+    if workers == 1:
+        partials = [reduce_chunk(accumulator_factory, c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(reduce_chunk, repeat(accumulator_factory),
+                                     chunks))
+    if not partials:
+        raise ValueError('No chunks given.')
+    return tree_merge(partials)
+
+
+def reduce_chunk(accumulator_factory, chunk):
+    ''' 
+        Creates an accumulator and feeds it one chunk. 
+        
+        A chunk is either an array with the samples as rows, or a tuple 
+        of such arrays (for example (values, dts) or, for PredictionStats, 
+        (a, b)). If the accumulator has update_batch(), the chunk is passed 
+        to it; otherwise update() is called for each row.
+    '''
+    accumulator = accumulator_factory()
+    feed_chunk(accumulator, chunk)
+    return accumulator
+
+
+def feed_chunk(accumulator, chunk):
+    ''' Feeds one chunk (see reduce_chunk()) to the accumulator. '''
+    if not isinstance(chunk, tuple):
+        chunk = (chunk,)
+    if hasattr(accumulator, 'update_batch'):
+        accumulator.update_batch(*chunk)
+    else:
+        for i in range(chunk[0].shape[0]):
+            accumulator.update(*[x[i] for x in chunk])
+
+
+def tree_merge(accumulators):
+    ''' 
+        Merges the accumulators pairwise, in rounds, preserving their 
+        order; returns the first one, into which everything is merged. 
+    '''
+    accumulators = list(accumulators)
+    while len(accumulators) > 1:
+        merged = []
+        for i in range(0, len(accumulators) - 1, 2):
+            accumulators[i].merge(accumulators[i + 1])
+            merged.append(accumulators[i])
+        if len(accumulators) % 2 == 1:
+            merged.append(accumulators[-1])
+        accumulators = merged
+    return accumulators[0]
@@ -3,22 +3,33 @@ from contracts import contract
 
 from astatsa.expectation import Expectation
 from astatsa.mean_variance import MeanVariance
+from astatsa.utils import contracts_bypassable, DerivedCache
+from astatsa.utils.state import (new_state, check_state, nest_state, 
+    unnest_state)
 
 
 __all__ = ['PredictionStats']
 
 
+@contracts_bypassable
 class  PredictionStats:
 
-    @contract(label_a='str', label_b='str')
-    def __init__(self, label_a='a', label_b='b'):
+    @contract(label_a='str', label_b='str', preallocate='bool')
+    def __init__(self, label_a='a', label_b='b', preallocate=False):
+        ''' 
+            If preallocate is True, update() works in preallocated 
+            buffers and does not allocate memory after the first call
+            (in fast mode); see MeanVariance.
+        '''
         self.label_a = label_a
         self.label_b = label_b
-        self.Ea = MeanVariance()
-        self.Eb = MeanVariance()
-        self.Edadb = Expectation()
-        self.R = None
-        self.R_needs_update = True
+        self.preallocate = preallocate
+        self.Ea = MeanVariance(preallocate=preallocate)
+        self.Eb = MeanVariance(preallocate=preallocate)
+        self.Edadb = Expectation(extremely_fast=preallocate)
+        self.da = None
+        self.db = None
+        self.cache = DerivedCache()
         self.num_samples = 0
         self.last_a = None
         self.last_b = None
@@ -27,28 +38,88 @@ class  PredictionStats:
     def update(self, a, b, dt=1.0):
         self.Ea.update(a, dt)
         self.Eb.update(b, dt)
-        da = a - self.Ea.get_mean()
-        db = b - self.Eb.get_mean()
-        self.Edadb.update(da * db, dt)
+        if self.preallocate:
+            if self.da is None:
+                self.da = np.empty_like(self.Ea.Ex())
+                self.db = np.empty_like(self.Eb.Ex())
+            da = np.subtract(a, self.Ea.Ex(), self.da)
+            db = np.subtract(b, self.Eb.Ex(), self.db)
+            self.Edadb.update(np.multiply(da, db, da), dt)
+        else:
+            da = a - self.Ea.get_mean()
+            db = b - self.Eb.get_mean()
+            self.Edadb.update(da * db, dt)
         self.num_samples += dt
 
-        self.R_needs_update = True
+        self.cache.invalidate()
         self.last_a = a
         self.last_b = b
 
+    def state_dict(self):
+        ''' Returns the state (see astatsa.utils.state). '''
+        state = new_state(self, label_a=self.label_a, label_b=self.label_b,
+                          preallocate=self.preallocate,
+                          num_samples=self.num_samples)
+        nest_state(state, 'Ea', self.Ea)
+        nest_state(state, 'Eb', self.Eb)
+        nest_state(state, 'Edadb', self.Edadb)
+        if self.last_a is not None:
+            state['last_a'] = self.last_a
+            state['last_b'] = self.last_b
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Returns an instance with the given state; does not copy. '''
+        check_state(state, cls)
+        ps = cls(label_a=state['label_a'], label_b=state['label_b'],
+                 preallocate=state.get('preallocate', False))
+        ps.Ea = unnest_state(state, 'Ea')
+        ps.Eb = unnest_state(state, 'Eb')
+        ps.Edadb = unnest_state(state, 'Edadb')
+        ps.num_samples = state['num_samples']
+        ps.last_a = state.get('last_a')
+        ps.last_b = state.get('last_b')
+        return ps
+
+    def merge(self, other):
+        ''' 
+            Merges the statistics of another PredictionStats; the cross 
+            term gets the same between-group correction as the variances.
+        '''
+        assert isinstance(other, PredictionStats)
+        if other.num_samples == 0:
+            return
+        wa = self.Edadb.get_mass()
+        wb = other.Edadb.get_mass()
+        cross_b = other.Edadb()
+        if wa > 0:
+            delta_a = other.Ea.get_mean() - self.Ea.get_mean()
+            delta_b = other.Eb.get_mean() - self.Eb.get_mean()
+            cross_b = cross_b + (wa / (wa + wb)) * delta_a * delta_b
+        self.Ea.merge(other.Ea)
+        self.Eb.merge(other.Eb)
+        self.Edadb.update(cross_b, float(wb))
+        self.num_samples += other.num_samples
+
+        self.cache.invalidate()
+        if other.last_a is not None:
+            self.last_a = other.last_a
+            self.last_b = other.last_b
+
     def get_correlation(self):
         ''' Returns the correlation between the two streams. '''
-        if self.R_needs_update:
-            std_a = self.Ea.get_std_dev()
-            std_b = self.Eb.get_std_dev()
-            p = std_a * std_b
-            zeros = p == 0
-            p[zeros] = 1
-            R = self.Edadb() / p
-            R[zeros] = np.NAN
-            self.R = R
-        self.R_needs_update = False
-        return self.R
+        return self.cache.get('correlation', self._compute_correlation)
+
+    def _compute_correlation(self):
+        std_a = self.Ea.get_std_dev()
+        std_b = self.Eb.get_std_dev()
+        p = std_a * std_b
+        zeros = p == 0
+        p[zeros] = 1
+        R = self.Edadb() / p
+        R[zeros] = np.NAN
+        return R
 
 
 
@@ -0,0 +1,104 @@
+'''
+    Accumulators updated concurrently by many threads.
+
+    Sharded gives each thread its own accumulator (shard), so that the
+    updates do not need a global lock: NumPy releases the GIL in its
+    kernels, so the threads can update their shards in parallel. The
+    shards are merged when a getter is called.
+'''
+import threading
+
+__all__ = ['Sharded']
+
+
+class Sharded(object):
+    '''
+        A thread-safe wrapper for an accumulator::
+
+            mc = Sharded(MeanCovariance)
+            # in each producer thread
+            mc.update(value, dt)
+            # in any thread
+            cov = mc.get_covariance()
+
+        update() and update_batch() go to the shard of the calling
+        thread. The get_*() methods are those of the merge of all the
+        shards, which is cached until the next update.
+    '''
+
+    def __init__(self, accumulator_factory):
+        '''
+            :param accumulator_factory: A callable returning a new
+                accumulator, which must support merge().
+        '''
+        self.accumulator_factory = accumulator_factory
+        self.local = threading.local()
+        self.shards = []
+        # protects shards and the cached merge
+        self.lock = threading.Lock()
+        self.merged_versions = None
+        self.merged_accumulator = None
+
+    def update(self, *args, **kwargs):
+        shard = self._get_shard()
+        with shard.lock:
+            shard.accumulator.update(*args, **kwargs)
+            shard.version += 1
+
+    def update_batch(self, *args, **kwargs):
+        shard = self._get_shard()
+        with shard.lock:
+            shard.accumulator.update_batch(*args, **kwargs)
+            shard.version += 1
+
+    def _get_shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = _Shard(self.accumulator_factory())
+            self.local.shard = shard
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def get_num_shards(self):
+        return len(self.shards)
+
+    def merged(self):
+        '''
+            Returns an accumulator with the merge of the shards; it is
+            shared by the callers until the next update, so it must not
+            be modified.
+        '''
+        with self.lock:
+            shards = list(self.shards)
+            versions = [shard.version for shard in shards]
+            if versions == self.merged_versions:
+                return self.merged_accumulator
+            merged = self.accumulator_factory()
+            for shard in shards:
+                # only waits for the update in progress, if any
+                with shard.lock:
+                    merged.merge(shard.accumulator)
+            # the versions read before merging, so that an update during
+            # the merge invalidates the result
+            self.merged_versions = versions
+            self.merged_accumulator = merged
+            return merged
+
+    def __getattr__(self, name):
+        if name.startswith('get_'):
+            return getattr(self.merged(), name)
+        raise AttributeError('%r object has no attribute %r' %
+                             (type(self).__name__, name))
+
+    def __call__(self):
+        return self.merged()()
+
+
+class _Shard(object):
+
+    def __init__(self, accumulator):
+        self.accumulator = accumulator
+        self.lock = threading.Lock()
+        # incremented by each update
+        self.version = 0
@@ -0,0 +1,104 @@
+'''
+    Computing statistics of datasets stored in .npy files, which can be
+    larger than the memory.
+
+    The file is memory-mapped and fed to an accumulator in chunks of
+    rows, using the batch update when available (see
+    parallel.feed_chunk()). While a chunk is reduced, the next one can
+    be read by a background thread.
+'''
+from concurrent.futures import ThreadPoolExecutor
+from math import gcd
+import numpy as np
+
+from .parallel import feed_chunk
+
+__all__ = ['reduce_file', 'auto_chunk_rows']
+
+# Default size of a chunk: large enough to amortize the per-chunk
+# overhead, small enough to stay in the outer cache levels.
+CHUNK_BYTES = 16 * 1024 * 1024
+
+PAGE_BYTES = 4096
+
+
+def reduce_file(path, accumulator, chunk_rows='auto', weights=None,
+                budget_bytes=None, prefetch=False):
+    '''
+        Feeds the rows of the array in the .npy file path to the
+        accumulator, in chunks, and returns the accumulator.
+
+        :param path: A .npy file, with the samples as rows.
+        :param accumulator: The accumulator to update.
+        :param chunk_rows: Number of rows per chunk, or 'auto' to use
+            auto_chunk_rows() with budget_bytes.
+        :param weights: An array (or the path of a .npy file) with one
+            row per sample, passed as the second argument of the updates
+            (the dts, or the weights for ExpectationWeighted).
+        :param budget_bytes: Size of the chunks for 'auto'
+            (default: CHUNK_BYTES).
+        :param prefetch: Whether to read the next chunk in a background
+            thread while the current one is reduced. This helps when the
+            file is not in the page cache.
+    '''
+    data = np.load(path, mmap_mode='r')
+    if data.ndim == 0:
+        raise ValueError('Expected an array of samples in %r.' % path)
+    nrows = data.shape[0]
+    arrays = [data]
+    if weights is not None:
+        if isinstance(weights, str):
+            weights = np.load(weights, mmap_mode='r')
+        if weights.shape[0] != nrows:
+            raise ValueError('Expected %d weights, got %d.' %
+                             (nrows, weights.shape[0]))
+        arrays.append(weights)
+
+    if chunk_rows == 'auto':
+        row_bytes = sum(x[:1].nbytes for x in arrays)
+        chunk_rows = auto_chunk_rows(row_bytes, budget_bytes)
+    if not chunk_rows >= 1:
+        raise ValueError('Invalid chunk_rows %r.' % chunk_rows)
+    chunk_rows = int(chunk_rows)
+    starts = range(0, nrows, chunk_rows)
+
+    def chunk(i0, copy):
+        i1 = min(nrows, i0 + chunk_rows)
+        # the copy reads the pages from the file
+        parts = tuple(np.array(x[i0:i1]) if copy else x[i0:i1]
+                      for x in arrays)
+        return parts if len(parts) > 1 else parts[0]
+
+    if not prefetch:
+        for i0 in starts:
+            feed_chunk(accumulator, chunk(i0, copy=False))
+        return accumulator
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = None
+        for i0 in starts:
+            if pending is None:
+                pending = pool.submit(chunk, i0, True)
+            current = pending.result()
+            following = i0 + chunk_rows
+            pending = (pool.submit(chunk, following, True)
+                       if following < nrows else None)
+            feed_chunk(accumulator, current)
+    return accumulator
+
+
+def auto_chunk_rows(row_bytes, budget_bytes=None):
+    '''
+        Returns the number of rows of row_bytes bytes each that fit in
+        budget_bytes (default: CHUNK_BYTES), rounded, when possible, to a
+        multiple that makes the chunks a whole number of pages.
+    '''
+    if budget_bytes is None:
+        budget_bytes = CHUNK_BYTES
+    row_bytes = max(1, int(row_bytes))
+    rows = max(1, budget_bytes // row_bytes)
+    # rows per chunk for a whole number of pages
+    step = PAGE_BYTES // gcd(row_bytes, PAGE_BYTES)
+    if rows >= step:
+        rows -= rows % step
+    return int(rows)
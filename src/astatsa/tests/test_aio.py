@@ -0,0 +1,122 @@
+from astatsa import (AsyncAccumulator, ExpectationFast, ExpectationWindowed,
+    MeanCovariance, MeanVariance)
+from astatsa.utils import assert_allclose
+import asyncio
+import numpy as np
+
+
+def test_async_accumulator():
+    X = np.random.randn(100, 4)
+    dts = np.random.rand(100) + 0.1
+
+    async def main():
+        acc = AsyncAccumulator(MeanCovariance(), max_queue=8, max_batch=5)
+        for i in range(100):
+            await acc.put(X[i], float(dts[i]))
+            assert acc.queue.qsize() <= 8
+        mc = await acc.snapshot()
+        mean = await acc.snapshot(lambda a: a.get_mean().copy())
+        await acc.close()
+        return mc, mean
+
+    mc, mean = asyncio.run(main())
+    assert_allclose(mc.get_num_samples(), dts.sum())
+    assert_allclose(mean, np.average(X, axis=0, weights=dts))
+    cov = np.cov(X.T, aweights=dts, bias=True)
+    assert_allclose(mc.get_covariance(), cov, atol=1e-12)
+
+
+def test_async_accumulator_producers():
+    X = np.random.randn(200, 3)
+
+    async def producer(acc, rows):
+        for x in rows:
+            await acc.put(x)
+
+    async def main():
+        acc = AsyncAccumulator(MeanVariance(), max_queue=4)
+        await asyncio.gather(*[producer(acc, X[i::4]) for i in range(4)])
+        var = await acc.snapshot(lambda a: a.get_var().copy())
+        await acc.close()
+        return var
+
+    assert_allclose(asyncio.run(main()), X.var(axis=0), rtol=0.1)
+
+
+def test_async_accumulator_error():
+    async def main():
+        acc = AsyncAccumulator(ExpectationFast())
+        await acc.put(np.array([1.0, np.nan]))
+        try:
+            await acc.join()
+        except ValueError:
+            pass
+        else:
+            raise Exception('Expected ValueError')
+        await acc.put(np.array([1.0, 2.0]))
+        e = await acc.snapshot()
+        await acc.close()
+        return e
+
+    assert_allclose(asyncio.run(main()).get_value(), [1.0, 2.0])
+
+
+def test_async_accumulator_rejected():
+    # the invalid samples do not drop the valid ones in the same batch
+    X = np.random.randn(20, 2)
+
+    async def main():
+        acc = AsyncAccumulator(MeanCovariance(), max_batch=10)
+        for i in range(20):
+            await acc.put(X[i])
+            if i in [3, 12]:
+                await acc.put(np.array([np.inf, 0.0]))
+        try:
+            await acc.join()
+        except ValueError as e:
+            assert len(e.errors) == 2
+        else:
+            raise Exception('Expected ValueError')
+        assert acc.num_rejected == 2
+        mc = await acc.snapshot()
+        await acc.close()
+        return mc
+
+    mc = asyncio.run(main())
+    assert_allclose(mc.get_num_samples(), 20)
+    assert_allclose(mc.get_mean(), X.mean(axis=0))
+
+
+def test_async_accumulator_rejected_not_atomic():
+    # the update_batch() of these can fail after applying part of the 
+    # batch: the valid samples must not be counted twice
+    X = np.random.randn(7, 2)
+
+    async def main(accumulator):
+        acc = AsyncAccumulator(accumulator, max_batch=10)
+        for i in range(7):
+            await acc.put(X[i])
+            if i == 4:
+                await acc.put(np.array([np.nan, 0.0]))
+        try:
+            await acc.join()
+        except ValueError:
+            pass
+        else:
+            raise Exception('Expected ValueError')
+        assert acc.num_rejected == 1
+        a = await acc.snapshot()
+        await acc.close()
+        return a
+
+    mv = asyncio.run(main(MeanVariance()))
+    assert_allclose(mv.num_samples, 7)
+    assert_allclose(mv.get_mean(), X.mean(axis=0))
+
+    ew = asyncio.run(main(ExpectationWindowed(window_samples=100)))
+    assert_allclose(ew.get_mass(), 7)
+    assert_allclose(ew.get_value(), X.mean(axis=0))
+
+    mc = asyncio.run(main(MeanCovariance(max_window=100, exact_window=True)))
+    assert_allclose(mc.get_num_samples(), 7)
+    assert_allclose(mc.get_mean(), X.mean(axis=0))
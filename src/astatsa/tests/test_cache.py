@@ -0,0 +1,54 @@
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.mean_variance import MeanVariance
+from astatsa.prediction import PredictionStats
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def check_readonly(x):
+    try:
+        x[...] = 0
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected a read-only array.')
+
+
+def test_mean_variance_cache():
+    mv = MeanVariance()
+    mv.update(np.array([1.0, 2.0]))
+    mv.update(np.array([3.0, 2.0]))
+    s = mv.get_std_dev()
+    assert mv.get_std_dev() is s
+    check_readonly(s)
+    check_readonly(mv.get_mean())
+    assert_allclose(s, np.sqrt(mv.get_var()))
+    mv.update(np.array([2.0, 2.0]))
+    assert mv.get_std_dev() is not s
+
+
+def test_mean_covariance_cache():
+    X = np.random.randn(20, 3)
+    mc = MeanCovariance()
+    mc.update_batch(X)
+    R = mc.get_correlation()
+    assert mc.get_correlation() is R
+    check_readonly(R)
+    check_readonly(mc.get_covariance())
+    check_readonly(mc.get_mean())
+    mc.update(X[0])
+    assert mc.get_correlation() is not R
+    assert_allclose(np.diag(mc.get_correlation()), 1)
+
+
+def test_prediction_stats_cache():
+    ps = PredictionStats()
+    a = np.random.randn(10, 2)
+    for x in a:
+        ps.update(x, 2 * x + 1)
+    R = ps.get_correlation()
+    assert ps.get_correlation() is R
+    check_readonly(R)
+    assert_allclose(R, [1, 1])
+    ps.update(a[0], -a[0])
+    assert ps.get_correlation() is not R
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+
+
+def test_import_is_lazy():
+    # Run in a fresh interpreter, as the test runner has imported everything.
+    code = ('import astatsa, logging, sys; '
+            'assert "numpy" not in sys.modules; '
+            'assert not logging.getLogger().handlers; '
+            'astatsa.MeanVariance; '
+            'assert "reprep" not in sys.modules')
+    subprocess.check_call([sys.executable, '-c', code])
@@ -0,0 +1,90 @@
+from astatsa.expectation import ExpectationFast, ExpectationSlow
+from astatsa.expectation_weighted import ExpectationWeighted
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.mean_variance import MeanVariance
+from astatsa.parallel import reduce
+from astatsa.prediction import PredictionStats
+from astatsa.utils import assert_allclose
+import numpy as np
+
+
+def test_merge_expectation():
+    x = np.random.randn(30, 3)
+    dts = np.random.rand(30) + 0.1
+    expected = np.average(x, axis=0, weights=dts)
+    for exp_class in [ExpectationSlow, ExpectationFast]:
+        e1 = exp_class()
+        e2 = exp_class()
+        for i in range(30):
+            (e1 if i < 10 else e2).update(x[i], float(dts[i]))
+        e1.merge(e2)
+        assert_allclose(e1.get_value(), expected)
+        assert_allclose(e1.get_mass(), dts.sum())
+        # merging into / from an empty accumulator
+        e3 = exp_class()
+        e3.merge(e1)
+        e3.merge(exp_class())
+        assert_allclose(e3.get_value(), expected)
+
+
+def test_merge_weighted():
+    e1 = ExpectationWeighted()
+    e2 = ExpectationWeighted()
+    e1.update(np.array([1.0, 1.0]), np.array([1.0, 0]))
+    e2.update(np.array([3.0, 5.0]), np.array([3.0, 0]))
+    e1.merge(e2)
+    assert_allclose(e1.get_value(fill_value=-1), [2.5, -1])
+    assert_allclose(e1.get_mass(), [4, 0])
+
+
+def test_merge_mean_variance():
+    # the two groups have zero variance, so the merged variance is only 
+    # the between-group term
+    mv1 = MeanVariance()
+    mv2 = MeanVariance()
+    for _ in range(3):
+        mv1.update(np.array([1.0, 0.0]))
+    mv2.update(np.array([5.0, 0.0]))
+    mv1.merge(mv2)
+    assert_allclose(mv1.get_mean(), [2.0, 0.0])
+    assert_allclose(mv1.get_var(), [3.0, 0.0])
+
+
+def test_merge_prediction_stats():
+    p1 = PredictionStats()
+    p2 = PredictionStats()
+    for _ in range(3):
+        p1.update(np.array([1.0]), np.array([2.0]))
+    p2.update(np.array([5.0]), np.array([-2.0]))
+    p1.merge(p2)
+    assert_allclose(p1.Edadb(), [-3.0])
+    assert_allclose(p1.get_correlation(), [-1.0])
+
+
+def test_merge_mean_covariance():
+    X = np.random.randn(100, 4)
+    mc1 = MeanCovariance()
+    mc2 = MeanCovariance()
+    mc1.update_batch(X[:30])
+    mc2.update_batch(X[30:])
+    mc1.merge(mc2)
+    assert_allclose(mc1.get_mean(), X.mean(axis=0))
+    assert_allclose(mc1.get_covariance(), np.cov(X.T, bias=True))
+    assert_allclose(mc1.get_maximum(), X.max(axis=0))
+    assert_allclose(mc1.get_minimum(), X.min(axis=0))
+    assert_allclose(mc1.get_num_samples(), 100)
+
+
+def test_parallel_reduce():
+    X = np.random.randn(1000, 5)
+    chunks = np.array_split(X, 7)
+    for workers in [1, 2]:
+        mc = reduce(MeanCovariance, chunks, workers=workers)
+        assert_allclose(mc.get_mean(), X.mean(axis=0))
+        assert_allclose(mc.get_covariance(), np.cov(X.T, bias=True))
+
+    a = np.random.randn(100, 2)
+    b = a + np.random.randn(100, 2)
+    ps = reduce(PredictionStats, [(a[:50], b[:50]), (a[50:], b[50:])],
+                workers=1)
+    assert_allclose(ps.Ea.get_mean(), a.mean(axis=0))
@@ -0,0 +1,50 @@
+from astatsa import ExpectationFast, MeanCovariance, Sharded
+from astatsa.utils import assert_allclose
+import numpy as np
+import threading
+
+
+def run_threads(target, n):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_sharded():
+    X = np.random.randn(400, 5)
+    dts = np.random.rand(400) + 0.1
+    mc = Sharded(MeanCovariance)
+
+    def producer(i):
+        for j in range(i, 200, 4):
+            mc.update(X[j], float(dts[j]))
+        mc.update_batch(X[200 + 50 * i:250 + 50 * i],
+                        dts[200 + 50 * i:250 + 50 * i])
+
+    run_threads(producer, 4)
+    assert mc.get_num_shards() == 4
+    assert_allclose(mc.get_num_samples(), dts.sum())
+    assert_allclose(mc.get_mean(), np.average(X, axis=0, weights=dts))
+    # cached until the next update
+    assert mc.merged() is mc.merged()
+    cov = mc.get_covariance()
+
+    mc.update(X[0])
+    assert_allclose(mc.get_num_samples(), dts.sum() + 1)
+    assert mc.get_covariance() is not cov
+
+
+def test_sharded_expectation():
+    X = np.random.randn(100, 3)
+    e = Sharded(ExpectationFast)
+    run_threads(lambda i: e.update_batch(X[i::2]), 2)
+    assert_allclose(e.get_value(), X.mean(axis=0))
+    assert_allclose(e(), X.mean(axis=0))
+    try:
+        e.reset()
+    except AttributeError:
+        pass
+    else:
+        raise Exception('Expected AttributeError')
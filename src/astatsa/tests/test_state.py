@@ -0,0 +1,185 @@
+from astatsa import (ExpectationFast, ExpectationFaster, ExpectationSlow,
+    ExpectationWindowed, ExpectationWeighted, MeanCovariance, MeanVariance,
+    PredictionStats)
+from astatsa.utils import assert_allclose, save_state, load_state, restore
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+def roundtrip(acc, update, get, formats=['state.npz', 'state'], rtol=1e-7):
+    ''' 
+        Checks that an accumulator restored from a checkpoint continues 
+        like the original one.
+    '''
+    dirname = tempfile.mkdtemp()
+    try:
+        for i in range(20):
+            update(acc, i)
+        for name in formats:
+            filename = os.path.join(dirname, name)
+            save_state(filename, acc.state_dict())
+            mmap_mode = None if name.endswith('.npz') else 'c'
+            state = load_state(filename, mmap_mode=mmap_mode)
+            acc2 = type(acc).from_state(state)
+            assert type(acc2) is type(acc)
+            assert type(restore(load_state(filename))) is type(acc)
+            assert_allclose(get(acc2), get(acc), rtol=rtol)
+        # the second copy continues with the same values
+        for i in range(20, 40):
+            update(acc, i)
+            update(acc2, i)
+        assert_allclose(get(acc2), get(acc), rtol=rtol)
+    finally:
+        shutil.rmtree(dirname)
+
+
+X = np.random.randn(40, 5)
+dts = np.random.rand(40) + 0.1
+
+
+def test_state_expectation():
+    update = lambda e, i: e.update(X[i], float(dts[i]))
+    get = lambda e: e.get_value()
+    roundtrip(ExpectationFast(), update, get)
+    roundtrip(ExpectationFast(max_window=5.0, compensated=True,
+                              accum_dtype='float32'), update, get,
+              rtol=1e-6)
+    roundtrip(ExpectationFaster(), update, get)
+    roundtrip(ExpectationSlow(max_window=3.0), update, get)
+    roundtrip(ExpectationWindowed(window_samples=7), update, get)
+    roundtrip(ExpectationWindowed(window_time=4.0), update, get)
+
+
+def test_state_weighted():
+    W = np.random.rand(40, 5)
+    update = lambda e, i: e.update(X[i], W[i])
+    roundtrip(ExpectationWeighted(), update, lambda e: e.get_value())
+    roundtrip(ExpectationWeighted(compensated=True), update,
+              lambda e: e.get_mass())
+
+
+def test_state_mean_variance():
+    update = lambda e, i: e.update(X[i], float(dts[i]))
+    get = lambda e: np.hstack((e.get_mean(), e.get_var()))
+    roundtrip(MeanVariance(), update, get)
+    roundtrip(MeanVariance(max_window=10, exact_window=True), update, get)
+
+
+def test_state_mean_covariance():
+    update = lambda e, i: e.update(X[i], float(dts[i]))
+    get = lambda e: np.vstack((e.get_mean(), e.get_covariance(),
+                               e.get_maximum()))
+    roundtrip(MeanCovariance(), update, get)
+    roundtrip(MeanCovariance(structure='diagonal'), update,
+              lambda e: e.get_covariance())
+    roundtrip(MeanCovariance(blocks=[[0, 3], [1, 2, 4]]), update,
+              lambda e: e.get_covariance().todense())
+    storage = tempfile.mkdtemp()
+    try:
+        roundtrip(MeanCovariance(storage_dir=storage, tile_rows=2), update,
+                  get)
+    finally:
+        shutil.rmtree(storage)
+
+
+def test_state_prediction():
+    Y = X + np.random.randn(40, 5)
+    update = lambda e, i: e.update(X[i], Y[i])
+    roundtrip(PredictionStats('x', 'y'), update,
+              lambda e: e.get_correlation())
+
+
+def test_state_empty():
+    for acc in [ExpectationFast(), ExpectationSlow(), ExpectationWeighted(),
+                MeanVariance(), MeanCovariance()]:
+        acc2 = restore(acc.state_dict())
+        assert type(acc2) is type(acc)
+
+
+def test_state_mmap():
+    dirname = tempfile.mkdtemp()
+    try:
+        mc = MeanCovariance()
+        mc.update_batch(X)
+        save_state(dirname, mc.state_dict())
+        mc2 = MeanCovariance.from_state(load_state(dirname, mmap_mode='r'))
+        assert isinstance(mc2.covariance_accum.accum, np.memmap)
+        assert_allclose(mc2.get_covariance(), mc.get_covariance())
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_state_wrong_class():
+    try:
+        MeanVariance.from_state(ExpectationFast().state_dict())
+    except ValueError:
+        pass
+    else:
+        raise Exception('Expected ValueError')
+
+
+def test_state_save_interrupted():
+    # a save that fails after writing some of the arrays leaves the 
+    # previous checkpoint readable and intact
+    dirname = tempfile.mkdtemp()
+    save = np.save
+    written = []
+
+    def failing_save(f, v):
+        if written:
+            raise IOError('simulated failure')
+        written.append(v)
+        save(f, v)
+
+    try:
+        mc = MeanCovariance()
+        mc.update_batch(X[:20])
+        save_state(dirname, mc.state_dict())
+        expected = mc.get_covariance().copy()
+
+        mc.update_batch(X[20:])
+        np.save = failing_save
+        try:
+            save_state(dirname, mc.state_dict())
+        except IOError:
+            pass
+        else:
+            raise Exception('Expected IOError')
+        finally:
+            np.save = save
+        mc2 = MeanCovariance.from_state(load_state(dirname))
+        assert_allclose(mc2.get_covariance(), expected)
+
+        # the next save completes and removes the old files
+        save_state(dirname, mc.state_dict())
+        mc3 = MeanCovariance.from_state(load_state(dirname))
+        assert_allclose(mc3.get_covariance(), mc.get_covariance())
+        state = mc.state_dict()
+        narrays = sum(isinstance(v, np.ndarray) for v in state.values())
+        assert len(os.listdir(dirname)) == narrays + 1
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_state_storage_dir():
+    # the restored covariance is still backed by a file in storage_dir
+    storage = tempfile.mkdtemp()
+    dirname = tempfile.mkdtemp()
+    try:
+        mc = MeanCovariance(storage_dir=storage, tile_rows=2)
+        mc.update_batch(X)
+        save_state(dirname, mc.state_dict())
+        mc2 = MeanCovariance.from_state(load_state(dirname, mmap_mode='c'))
+        accum = mc2.covariance_accum
+        assert os.path.dirname(accum.filename) == storage
+        assert accum.filename != mc.covariance_accum.filename
+        mc2.update(X[0])
+        accum.flush()
+        on_disk = np.memmap(accum.filename, dtype=accum.dtype, mode='r',
+                            shape=accum.value.shape)
+        assert_allclose(on_disk, mc2.get_covariance())
+    finally:
+        shutil.rmtree(storage)
+        shutil.rmtree(dirname)
@@ -0,0 +1,51 @@
+from astatsa import (ExpectationFast, ExpectationWeighted, MeanCovariance,
+    MeanVariance)
+from astatsa.stream import reduce_file, auto_chunk_rows
+from astatsa.utils import assert_allclose
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+def test_reduce_file():
+    dirname = tempfile.mkdtemp()
+    try:
+        X = np.random.randn(1000, 4)
+        dts = np.random.rand(1000) + 0.1
+        path = os.path.join(dirname, 'data.npy')
+        np.save(path, X)
+        np.save(os.path.join(dirname, 'dts.npy'), dts)
+
+        expected = MeanCovariance()
+        expected.update_batch(X, dts)
+        for chunk_rows in ['auto', 1, 77, 5000]:
+            for prefetch in [False, True]:
+                mc = reduce_file(path, MeanCovariance(), chunk_rows=chunk_rows,
+                                 weights=dts, prefetch=prefetch)
+                assert_allclose(mc.get_covariance(),
+                                expected.get_covariance())
+                assert_allclose(mc.get_mean(), expected.get_mean())
+
+        e = reduce_file(path, ExpectationFast(), chunk_rows=100,
+                        weights=os.path.join(dirname, 'dts.npy'))
+        assert_allclose(e.get_value(), np.average(X, axis=0, weights=dts))
+
+        # without update_batch(), row by row
+        mv = reduce_file(path, MeanVariance(), budget_bytes=1024)
+        assert_allclose(mv.get_mean(), X.mean(axis=0))
+
+        W = np.random.rand(1000, 4)
+        ew = reduce_file(path, ExpectationWeighted(), weights=W,
+                         prefetch=True, chunk_rows=64)
+        assert_allclose(ew.get_value(), np.sum(X * W, axis=0) / W.sum(axis=0))
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_auto_chunk_rows():
+    assert auto_chunk_rows(8 * 100, budget_bytes=1024 * 1024) == 1280
+    assert auto_chunk_rows(10 ** 9) == 1
+    for row_bytes in [24, 100, 4096, 5000]:
+        rows = auto_chunk_rows(row_bytes, budget_bytes=10 ** 6)
+        assert 1 <= rows * row_bytes <= 10 ** 6
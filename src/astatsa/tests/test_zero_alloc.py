@@ -0,0 +1,101 @@
+from astatsa import (set_fast_mode, ExpectationFaster, ExpectationWindowed,
+    ExpectationWeighted, MeanVariance, MeanCovariance, PredictionStats)
+from astatsa.utils import assert_allclose, in_fast_mode
+import functools
+import tracemalloc
+import numpy as np
+
+
+def allocated_bytes(update, X, warmup=10):
+    ''' Returns the peak of the memory allocated by update(X[i]). '''
+    for i in range(warmup):
+        update(X[i])
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        for i in range(warmup, X.shape[0]):
+            update(X[i])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def check_zero_alloc(name, update, X):
+    # this leaves room for the small Python objects (views, floats) 
+    # but not for a temporary array
+    max_bytes = X[0].nbytes // 2
+    nbytes = allocated_bytes(update, X)
+    assert nbytes < max_bytes, '%s allocated %d bytes' % (name, nbytes)
+
+
+def fast_mode(test):
+    ''' Runs the test without the contracts, which allocate. '''
+    @functools.wraps(test)
+    def wrapper():
+        # (before binding the methods)
+        was_fast = in_fast_mode()
+        set_fast_mode(True)
+        try:
+            test()
+        finally:
+            set_fast_mode(was_fast)
+    return wrapper
+
+
+@fast_mode
+def test_zero_alloc():
+    X = np.random.randn(110, 2000)
+    Y = np.random.randn(110, 2000)
+    cases = [
+        ('ExpectationFaster', ExpectationFaster()),
+        ('ExpectationFaster compensated', ExpectationFaster(compensated=True)),
+        ('ExpectationWindowed', ExpectationWindowed(window_samples=20)),
+        ('MeanVariance', MeanVariance(preallocate=True)),
+        ('MeanCovariance diagonal',
+         MeanCovariance(structure='diagonal', preallocate=True)),
+    ]
+    for name, acc in cases:
+        check_zero_alloc(name, acc.update, X)
+
+    W = np.random.rand(110, 2000)
+    for compensated in [False, True]:
+        ew = ExpectationWeighted(compensated=compensated)
+        update = lambda x: (ew.update(x, W[0]), ew.get_value(), ew.get_mass())
+        check_zero_alloc('ExpectationWeighted', update, X)
+
+    ps = PredictionStats(preallocate=True)
+    check_zero_alloc('PredictionStats', lambda x: ps.update(x, x[::-1]), X)
+
+    ps2 = PredictionStats()
+    for x in X:
+        ps2.update(x, x[::-1])
+    assert_allclose(ps.get_correlation(), ps2.get_correlation())
+
+    mv = MeanVariance(preallocate=True)
+    mv2 = MeanVariance()
+    for y in Y:
+        mv.update(y)
+        mv2.update(y)
+    assert_allclose(mv.get_var(), mv2.get_var())
+
+
+@fast_mode
+def test_zero_alloc_covariance():
+    X = np.random.randn(110, 500)
+    blocks = [list(range(0, 100)), list(range(100, 500))]
+    for kwargs in [dict(), dict(max_window=50.0), dict(blocks=blocks)]:
+        mc = MeanCovariance(preallocate=True, **kwargs)
+        check_zero_alloc('MeanCovariance %s' % sorted(kwargs), mc.update, X)
+
+        mc2 = MeanCovariance(**kwargs)
+        for x in X:
+            mc2.update(x)
+        assert_allclose(mc.get_mean(), mc2.get_mean())
+        if 'blocks' in kwargs:
+            for a, b in zip(mc.get_covariance().blocks,
+                            mc2.get_covariance().blocks):
+                assert_allclose(a, b)
+        else:
+            assert_allclose(mc.get_covariance(), mc2.get_covariance())
+        assert_allclose(mc.get_maximum(), X.max(axis=0))
@@ -1,2 +1,8 @@
 from .np_comparisons import *
 from .outer_product import *
+from .fast_mode import *
+from .summation import *
+from .cache import *
+from .state import *
+from .validation import *
+from .instrumentation import *
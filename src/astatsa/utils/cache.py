@@ -0,0 +1,33 @@
+''' Caching of the quantities derived from the state of an accumulator. '''
+import numpy as np
+
+__all__ = ['DerivedCache', 'readonly']
+
+
+class DerivedCache(object):
+    ''' 
+        Holds the derived quantities (standard deviations, correlations, 
+        factorizations, ...) of an accumulator, which calls invalidate() 
+        whenever its state changes. The cached arrays are read-only, so 
+        that the callers cannot corrupt them. 
+    '''
+
+    def __init__(self):
+        self.values = {}
+
+    def invalidate(self):
+        self.values.clear()
+
+    def get(self, key, compute):
+        ''' Returns the value for key, calling compute() if needed. '''
+        if not key in self.values:
+            self.values[key] = readonly(compute())
+        return self.values[key]
+
+
+def readonly(x):
+    ''' Returns a read-only view of x if it is an array, else x. '''
+    if isinstance(x, np.ndarray):
+        x = x.view()
+        x.flags.writeable = False
+    return x
@@ -0,0 +1,79 @@
+''' 
+    A switch to bypass the PyContracts checks in the hot paths.
+
+    The accumulators decorate update() and friends with @contract; 
+    for small arrays, checking the contracts costs more than the 
+    arithmetic. In "fast mode", the registered classes bind the 
+    undecorated implementations instead, so that calls have no 
+    checking overhead at all (not even the one of a disabled contract). 
+    
+    Fast mode is enabled either by setting the environment variable 
+    ASTATSA_FAST_MODE=1 before importing astatsa, or by calling 
+    set_fast_mode(). The checks are kept in the default (debug) mode. 
+    
+    The same registry is used to switch the instrumentation on and off
+    (see instrumentation.py).
+'''
+import inspect
+import os
+
+__all__ = ['set_fast_mode', 'in_fast_mode', 'contracts_bypassable']
+
+ENV_VARIABLE = 'ASTATSA_FAST_MODE'
+
+
+class FastMode(object):
+    enabled = os.environ.get(ENV_VARIABLE, '') not in ['', '0']
+    # list of tuples (class, checked methods, unchecked methods)
+    registered = []
+    # if not None, wrap(name, f) returns the method to bind
+    wrap = None
+
+
+def in_fast_mode():
+    ''' Returns True if the contracts checks are bypassed. '''
+    return FastMode.enabled
+
+
+def set_fast_mode(enabled=True):
+    ''' Enables (or disables) fast mode for all the accumulators. '''
+    FastMode.enabled = bool(enabled)
+    rebind_all()
+
+
+def rebind_all():
+    ''' Binds the methods of all the classes for the current modes. '''
+    for cls, checked, unchecked in FastMode.registered:
+        _bind(cls, unchecked if FastMode.enabled else checked)
+
+
+def contracts_bypassable(cls):
+    ''' 
+        Class decorator that registers the methods of the class, 
+        so that set_fast_mode() can switch the contract-decorated ones.
+    '''
+    checked = {}
+    unchecked = {}
+    for name, f in list(cls.__dict__.items()):
+        if hasattr(f, '__contracts__') and hasattr(f, '__wrapped__'):
+            checked[name] = f
+            unchecked[name] = _undecorated(f)
+        elif inspect.isfunction(f) and not name.startswith('__'):
+            checked[name] = unchecked[name] = f
+    FastMode.registered.append((cls, checked, unchecked))
+    if FastMode.enabled or FastMode.wrap is not None:
+        _bind(cls, unchecked if FastMode.enabled else checked)
+    return cls
+
+
+def _undecorated(f):
+    while hasattr(f, '__contracts__') and hasattr(f, '__wrapped__'):
+        f = f.__wrapped__
+    return f
+
+
+def _bind(cls, methods):
+    for name, f in methods.items():
+        if FastMode.wrap is not None:
+            f = FastMode.wrap(name, f)
+        setattr(cls, name, f)
@@ -0,0 +1,51 @@
+from astatsa.expectation import ExpectationFast, ExpectationSlow
+from astatsa.expectation import expectation_slow
+from astatsa.mean_variance import MeanVariance
+from astatsa.utils import set_fast_mode, in_fast_mode, assert_allclose
+from contracts import ContractNotRespected
+import numpy as np
+
+
+def test_fast_mode_switch():
+    was = in_fast_mode()
+    try:
+        set_fast_mode(False)
+        e = ExpectationFast()
+        try:
+            e.update(np.array([1.0]), dt=-1.0)
+        except ContractNotRespected:
+            pass
+        else:
+            raise Exception('Expected the contract to be checked.')
+        assert hasattr(ExpectationFast.update, '__contracts__')
+
+        set_fast_mode(True)
+        assert not hasattr(ExpectationFast.update, '__contracts__')
+        assert not hasattr(MeanVariance.update, '__contracts__')
+        mv = MeanVariance()
+        for x in [1.0, 2.0, 3.0]:
+            mv.update(np.array([x]))
+        assert_allclose(mv.get_mean(), [2.0])
+    finally:
+        set_fast_mode(was)
+
+
+def test_fast_mode_helpers():
+    # the methods do not call the checked module-level functions
+    was = in_fast_mode()
+    checked = expectation_slow.weighted_average
+    try:
+        set_fast_mode(True)
+        def fail(*args):
+            raise Exception('The contracts should be bypassed.')
+        expectation_slow.weighted_average = fail
+        e = ExpectationSlow()
+        for x in [1.0, 2.0, 3.0]:
+            e.update(np.array([x]))
+        e2 = ExpectationSlow()
+        e2.update(np.array([2.0]))
+        e.merge(e2)
+        assert_allclose(e.get_value(), [2.0])
+    finally:
+        expectation_slow.weighted_average = checked
+        set_fast_mode(was)
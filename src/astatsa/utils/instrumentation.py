@@ -0,0 +1,150 @@
+'''
+    Optional instrumentation of the accumulators.
+
+    When enabled with set_instrumentation(), the update*(), merge() and
+    get_*() methods of the classes registered with @contracts_bypassable
+    are replaced by wrappers that record, per class, the number of calls
+    and the time spent in each method; if tracemalloc is tracing, also
+    the bytes allocated (the peak of the temporary allocations). When
+    disabled (the default), the original methods are bound again, so
+    there is no overhead at all.
+
+    get_instrumentation() returns the statistics as a dictionary,
+    for example to be scraped by a metrics agent::
+
+        {'MeanCovariance': {
+            'methods': {'update': {'calls': 10, 'seconds': 0.01,
+                                   'bytes_allocated': 2048}, ...},
+            'events': {...},
+            'instances': 1,
+            'state_bytes': 8320}, ...}
+
+    The times are inclusive: the update of a MeanVariance includes the
+    ones of its two Expectations, which are also counted. The bytes
+    allocated are measured only for the outermost instrumented call 
+    (so the update of the MeanVariance includes the allocations of its
+    Expectations, and theirs are not counted). Before Python 3.9, which
+    cannot reset the peak, they are the growth of the traced memory 
+    instead of its peak.
+'''
+from collections import defaultdict
+import functools
+import threading
+import time
+import tracemalloc
+import weakref
+import numpy as np
+
+from .fast_mode import FastMode, rebind_all
+
+__all__ = ['set_instrumentation', 'get_instrumentation',
+           'reset_instrumentation']
+
+
+class Instrumentation(object):
+    enabled = False
+    callback = None
+    # class name -> method name -> {'calls', 'seconds', 'bytes_allocated'}
+    methods = defaultdict(lambda: defaultdict(
+        lambda: {'calls': 0, 'seconds': 0.0, 'bytes_allocated': 0}))
+    # class name -> event name -> count
+    events = defaultdict(lambda: defaultdict(int))
+    # class name -> the instances seen
+    instances = defaultdict(weakref.WeakSet)
+    # .depth: number of instrumented calls in progress, per thread
+    local = threading.local()
+
+
+def set_instrumentation(enabled=True, callback=None):
+    '''
+        Enables (or disables) the instrumentation of all the
+        accumulators. If given, callback(accumulator, method, seconds)
+        is called after each instrumented call.
+    '''
+    Instrumentation.enabled = bool(enabled)
+    Instrumentation.callback = callback if enabled else None
+    FastMode.wrap = _instrumented if enabled else None
+    rebind_all()
+
+
+def reset_instrumentation():
+    ''' Clears the statistics collected so far. '''
+    Instrumentation.methods.clear()
+    Instrumentation.events.clear()
+    Instrumentation.instances.clear()
+
+
+def get_instrumentation():
+    ''' Returns the statistics collected so far, as a dictionary. '''
+    names = (set(Instrumentation.methods) | set(Instrumentation.events))
+    result = {}
+    for name in sorted(names):
+        instances = list(Instrumentation.instances[name])
+        result[name] = {
+            'methods': dict((m, dict(s)) for m, s in
+                            Instrumentation.methods[name].items()),
+            'events': dict(Instrumentation.events[name]),
+            'instances': len(instances),
+            'state_bytes': sum(state_bytes(x) for x in instances),
+        }
+    return result
+
+
+def record_event(obj, event):
+    ''' Counts an event (for example, a normalization) for obj's class. '''
+    Instrumentation.events[type(obj).__name__][event] += 1
+
+
+def state_bytes(obj):
+    ''' Returns the size of the arrays in the state of obj. '''
+    if not hasattr(obj, 'state_dict'):
+        return 0
+    return sum(v.nbytes for v in obj.state_dict().values()
+               if isinstance(v, np.ndarray))
+
+
+def is_instrumented(name):
+    ''' Whether the method with this name is instrumented. '''
+    return (name in ['update', 'update_batch', 'merge'] or
+            name.startswith('get_'))
+
+
+# (Python >= 3.9)
+_reset_peak = getattr(tracemalloc, 'reset_peak', None)
+
+
+def _instrumented(name, f):
+    if not is_instrumented(name):
+        return f
+
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        local = Instrumentation.local
+        depth = getattr(local, 'depth', 0)
+        # an inner call would reset the peak of the outer one
+        tracing = depth == 0 and tracemalloc.is_tracing()
+        if tracing:
+            before, _ = tracemalloc.get_traced_memory()
+            if _reset_peak is not None:
+                _reset_peak()
+        local.depth = depth + 1
+        t0 = time.perf_counter()
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - t0
+            local.depth = depth
+            cls = type(self).__name__
+            stats = Instrumentation.methods[cls][name]
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                if _reset_peak is None:
+                    peak = current
+                stats['bytes_allocated'] += max(0, peak - before)
+            Instrumentation.instances[cls].add(self)
+            if Instrumentation.callback is not None:
+                Instrumentation.callback(self, name, seconds)
+
+    return wrapper
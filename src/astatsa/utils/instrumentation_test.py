@@ -0,0 +1,92 @@
+from astatsa.expectation import ExpectationFast
+from astatsa.mean_covariance import MeanCovariance
+from astatsa.mean_variance import MeanVariance
+from astatsa.utils import (set_instrumentation, get_instrumentation,
+    reset_instrumentation, set_fast_mode, in_fast_mode)
+import numpy as np
+import tracemalloc
+
+
+def test_instrumentation():
+    original = ExpectationFast.update
+    calls = []
+    try:
+        set_instrumentation(True, callback=lambda a, m, s: calls.append(m))
+        assert ExpectationFast.update is not original
+        reset_instrumentation()
+        e = ExpectationFast(renormalize_interval=10)
+        for _ in range(150):
+            e.update(np.ones(3))
+        e.update(np.ones(3) * 1e300)
+        for _ in range(9):
+            e.update(np.ones(3))
+        e.get_value()
+        mc = MeanCovariance()
+        tracemalloc.start()
+        try:
+            mc.update_batch(np.random.randn(10, 4))
+        finally:
+            tracemalloc.stop()
+        mc.get_covariance()
+
+        stats = get_instrumentation()
+        fast = stats['ExpectationFast']
+        assert fast['methods']['update']['calls'] >= 160
+        assert fast['methods']['update']['seconds'] > 0
+        assert fast['events']['renormalizations'] == 1
+        assert fast['state_bytes'] >= 3 * 8
+        cov = stats['MeanCovariance']
+        assert cov['methods']['update_batch']['calls'] == 1
+        assert cov['methods']['update_batch']['bytes_allocated'] > 0
+        assert cov['methods']['get_covariance']['calls'] == 1
+        assert cov['instances'] == 1
+        assert cov['state_bytes'] >= 16 * 8
+        assert 'update' in calls and 'get_covariance' in calls
+    finally:
+        set_instrumentation(False)
+        reset_instrumentation()
+    assert ExpectationFast.update is original
+    assert get_instrumentation() == {}
+
+
+def test_instrumentation_fast_mode():
+    was = in_fast_mode()
+    try:
+        set_fast_mode(False)
+        set_instrumentation(True)
+        set_fast_mode(True)
+        # both switches apply
+        assert not hasattr(ExpectationFast.update, '__contracts__')
+        mv = MeanVariance()
+        mv.update(np.array([1.0]))
+        assert get_instrumentation()['MeanVariance']['methods']['update']
+    finally:
+        set_instrumentation(False)
+        reset_instrumentation()
+        set_fast_mode(was)
+
+
+def test_instrumentation_nested():
+    # the allocations of MeanCovariance.update() include the ones of
+    # the nested Expectation updates, which do not reset the peak
+    try:
+        set_instrumentation(True)
+        reset_instrumentation()
+        mc = MeanCovariance()
+        x = np.random.randn(300)
+        mc.update(x)
+        tracemalloc.start()
+        try:
+            mc.update(x)
+        finally:
+            tracemalloc.stop()
+        stats = get_instrumentation()
+        cov = stats['MeanCovariance']['methods']['update']
+        # at least the 300 x 300 outer product
+        assert cov['bytes_allocated'] >= 300 * 300 * 8
+        fast = stats['ExpectationFast']['methods']
+        assert fast['update']['calls'] == 4
+        assert fast['update']['bytes_allocated'] == 0
+    finally:
+        set_instrumentation(False)
+        reset_instrumentation()
@@ -125,6 +125,18 @@ def check_all_finite(value):
 
 
 def all_finite(x):
-    """ Fast way to check that all elements of an array are finite. """
-    return np.isfinite(np.min(x)) and np.isfinite(np.max(x))
+    """ 
+        Fast way to check that all elements of an array are finite,
+        in one pass: the sum is finite unless some element is nan or 
+        inf, or the sum overflows (then we check each element). 
+    """
+    if isinstance(x, np.ndarray) and x.flags.c_contiguous:
+        # (reducing a 1D view does not allocate the iterator's buffers)
+        x = x.reshape(-1)
+    # (the overflow of the sum is expected)
+    with np.errstate(over='ignore', invalid='ignore'):
+        total = np.sum(x)
+    if np.isfinite(total):
+        return True
+    return bool(np.all(np.isfinite(x)))
 
@@ -0,0 +1,210 @@
+'''
+    Checkpointing of the state of the accumulators.
+
+    The accumulators have a state_dict() method, which returns a flat
+    dictionary of numpy arrays and plain Python values (numbers, strings,
+    None), and a class method from_state(), which builds an accumulator
+    from such a dictionary. The arrays are not copied in either
+    direction: save the state before the next update.
+
+    save_state() writes a state either to a ".npz" file or, for any other
+    filename, to a directory with one ".npy" file per array, which
+    load_state() can memory-map instead of reading.
+'''
+import json
+import os
+import re
+import tempfile
+import numpy as np
+
+__all__ = ['save_state', 'load_state', 'restore']
+
+STATE_VERSION = 1
+
+META_KEY = '__meta__'
+META_FILE = 'state.json'
+
+
+def save_state(filename, state):
+    '''
+        Writes the state to filename: a ".npz" file if the name ends
+        with ".npz", otherwise a directory of ".npy" files. 
+        
+        The ".npz" file is replaced atomically. In the directory, the 
+        arrays are written to new files (numbered by a generation) and 
+        the metadata file, which lists them, is replaced last: until 
+        then, load_state() reads the previous checkpoint, so a crash 
+        leaves it intact. The files of the previous generation are then 
+        deleted; the processes that memory-mapped them are not affected.
+    '''
+    arrays = {}
+    meta = {'__format__': STATE_VERSION, '__arrays__': []}
+    for k, v in state.items():
+        if isinstance(v, np.ndarray):
+            arrays[k] = v
+            meta['__arrays__'].append(k)
+        elif isinstance(v, np.generic):
+            meta[k] = v.item()
+        else:
+            meta[k] = v
+    text = json.dumps(meta, sort_keys=True)
+
+    if filename.endswith('.npz'):
+        arrays[META_KEY] = np.array(text)
+        dirname = os.path.dirname(os.path.abspath(filename))
+        with _atomic(dirname, filename, '.npz') as f:
+            np.savez(f, **arrays)
+    else:
+        if not os.path.exists(filename):
+            os.makedirs(filename)
+        previous = _read_meta(filename)
+        generation = (previous.get('__generation__') or 0) + 1
+        meta['__generation__'] = generation
+        text = json.dumps(meta, sort_keys=True)
+        for k, v in arrays.items():
+            path = os.path.join(filename, _array_file(k, generation))
+            with _atomic(filename, path, '.npy') as f:
+                np.save(f, v)
+        # written last: this commits the new generation
+        with _atomic(filename, os.path.join(filename, META_FILE),
+                     '.json') as f:
+            f.write(text.encode('utf-8'))
+        _delete_stale_arrays(filename, generation, previous)
+
+
+def load_state(filename, mmap_mode=None):
+    '''
+        Reads a state written by save_state(). For the directory format,
+        mmap_mode is passed to numpy.load(): use 'c' (copy-on-write) to
+        restore an accumulator that will be updated without modifying
+        the files, or 'r' for read-only access.
+    '''
+    if filename.endswith('.npz'):
+        with np.load(filename) as data:
+            meta = json.loads(str(data[META_KEY]))
+            arrays = dict((k, data[k]) for k in meta['__arrays__'])
+    else:
+        with open(os.path.join(filename, META_FILE), 'rb') as f:
+            meta = json.loads(f.read().decode('utf-8'))
+        generation = meta.get('__generation__')
+        arrays = dict((k, np.load(os.path.join(filename, 
+                                               _array_file(k, generation)),
+                                  mmap_mode=mmap_mode))
+                      for k in meta['__arrays__'])
+    if meta['__format__'] > STATE_VERSION:
+        raise ValueError('Unsupported state format %r in %r.' %
+                         (meta['__format__'], filename))
+    state = dict((k, v) for k, v in meta.items()
+                 if not k in ['__format__', '__arrays__', '__generation__'])
+    state.update(arrays)
+    return state
+
+
+def restore(state):
+    ''' Returns an accumulator of the class recorded in the state. '''
+    import astatsa
+    name = state['__class__']
+    try:
+        cls = getattr(astatsa, name)
+    except AttributeError:
+        raise ValueError('Unknown accumulator class %r.' % name)
+    return cls.from_state(state)
+
+
+def _array_file(key, generation):
+    # (the checkpoints written before the generations were introduced 
+    # have one file per key)
+    if generation is None:
+        return key + '.npy'
+    return '%s.%d.npy' % (key, generation)
+
+
+def _read_meta(dirname):
+    ''' Returns the metadata of the checkpoint in dirname, or {}. '''
+    try:
+        with open(os.path.join(dirname, META_FILE), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _delete_stale_arrays(dirname, generation, previous):
+    ''' 
+        Deletes the array files of the previous checkpoint and the ones
+        left by saves that did not complete.
+    '''
+    stale = set(_array_file(k, previous.get('__generation__'))
+                for k in previous.get('__arrays__', []))
+    numbered = re.compile(r'^.+\.(\d+)\.npy$')
+    for name in os.listdir(dirname):
+        match = numbered.match(name)
+        if match is not None and int(match.group(1)) != generation:
+            stale.add(name)
+    for name in stale:
+        path = os.path.join(dirname, name)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class _atomic(object):
+    ''' Writes to a temporary file that is then renamed to filename. '''
+
+    def __init__(self, dirname, filename, suffix):
+        self.dirname = dirname
+        self.filename = filename
+        self.suffix = suffix
+
+    def __enter__(self):
+        fd, self.tmp = tempfile.mkstemp(prefix='.astatsa-', suffix=self.suffix,
+                                        dir=self.dirname)
+        self.f = os.fdopen(fd, 'wb')
+        return self.f
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.filename)
+        else:
+            os.unlink(self.tmp)
+
+
+# Helpers for the implementations of state_dict() and from_state()
+
+def new_state(obj, **values):
+    ''' Returns a state for obj with the class name and the version. '''
+    state = {'__class__': type(obj).__name__,
+             '__version__': STATE_VERSION}
+    state.update(values)
+    return state
+
+
+def check_state(state, cls):
+    if state.get('__class__') != cls.__name__:
+        raise ValueError('Expected a state of %s, got %r.' %
+                         (cls.__name__, state.get('__class__')))
+    if state['__version__'] > STATE_VERSION:
+        raise ValueError('Unsupported version %r of the %s state.' %
+                         (state['__version__'], cls.__name__))
+
+
+def nest_state(state, prefix, sub):
+    ''' Adds the state of a sub-accumulator (if not None) to state. '''
+    if sub is not None:
+        for k, v in sub.state_dict().items():
+            state['%s.%s' % (prefix, k)] = v
+
+
+def unnest_state(state, prefix):
+    ''' Restores a sub-accumulator added by nest_state(), or None. '''
+    p = prefix + '.'
+    sub = dict((k[len(p):], v) for k, v in state.items() if k.startswith(p))
+    if not sub:
+        return None
+    return restore(sub)
+
+
+def dtype_name(dtype):
+    ''' Returns a name for dtype that can be stored in the metadata. '''
+    if dtype is None:
+        return None
+    return np.dtype(dtype).name
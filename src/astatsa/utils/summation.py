@@ -0,0 +1,41 @@
+''' Compensated summation for the accumulators. '''
+import numpy as np
+
+__all__ = ['compensated_add', 'compensation_scratch']
+
+
+def compensated_add(accum, compensation, x, scratch=None):
+    ''' 
+        Computes accum += x in place using Neumaier's variant of Kahan
+        summation: the low-order bits lost in each addition are 
+        accumulated in the array compensation, so that accum + compensation
+        is accurate to the precision of the storage dtype, regardless
+        of the number of additions.
+        
+        If scratch is given (see compensation_scratch()), the temporaries
+        are written there and nothing is allocated.
+    '''
+    x = np.asarray(x, dtype=accum.dtype)
+    if scratch is not None:
+        t, a, b, big = scratch
+        np.add(accum, x, t)
+        np.greater_equal(np.abs(accum, a), np.abs(x, b), big)
+        # a = (accum - t) + x, b = (x - t) + accum
+        np.add(np.subtract(accum, t, a), x, a)
+        np.add(np.subtract(x, t, b), accum, b)
+        np.copyto(b, a, where=big)
+        compensation += b
+        np.copyto(accum, t)
+        return
+    t = accum + x
+    # the smaller of the two operands is the one that loses bits
+    big = np.abs(accum) >= np.abs(x)
+    lost = np.where(big, (accum - t) + x, (x - t) + accum)
+    compensation += lost
+    accum[...] = t
+
+
+def compensation_scratch(template):
+    ''' Returns the scratch buffers for compensated_add(). '''
+    return (np.empty_like(template), np.empty_like(template),
+            np.empty_like(template), np.empty(template.shape, dtype=bool))
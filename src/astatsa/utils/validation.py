@@ -0,0 +1,57 @@
+''' Policies for checking that the samples given to an accumulator are finite. '''
+from .np_comparisons import check_all_finite
+
+__all__ = ['Validation']
+
+
+class Validation(object):
+    '''
+        When to check that the values are finite:
+
+        - 'always': each sample, in update();
+        - 'sampled': one update every ``interval``;
+        - 'on_read': the accumulated values, when the result is computed
+          in the getter (so a non-finite sample is detected late, but
+          the cost is independent of the number of updates);
+        - 'never'.
+
+        The accumulators take either the name of a policy or an
+        instance (to choose the interval).
+    '''
+
+    POLICIES = ['always', 'sampled', 'on_read', 'never']
+
+    def __init__(self, policy='always', interval=16):
+        if not policy in Validation.POLICIES:
+            raise ValueError('Invalid validation policy %r; expected one of %s.'
+                             % (policy, Validation.POLICIES))
+        if not interval >= 1:
+            raise ValueError('Invalid interval %r.' % interval)
+        self.policy = policy
+        self.interval = int(interval)
+        self.count = 0
+
+    @staticmethod
+    def from_policy(validation):
+        ''' Returns a new Validation from a policy name or an instance. '''
+        if isinstance(validation, Validation):
+            return Validation(validation.policy, validation.interval)
+        return Validation(validation)
+
+    def check_update(self, *values):
+        ''' Called by update() with the new sample. '''
+        if self.policy == 'always':
+            for value in values:
+                check_all_finite(value)
+        elif self.policy == 'sampled':
+            self.count += 1
+            if self.count >= self.interval:
+                self.count = 0
+                for value in values:
+                    check_all_finite(value)
+
+    def check_read(self, *values):
+        ''' Called by the getters with the accumulated values. '''
+        if self.policy == 'on_read':
+            for value in values:
+                check_all_finite(value)